@@ -2,15 +2,25 @@
 
 import logging
 
+import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
 from tornado.options import define, options
 
 import util.settings
+from util.templates import TemplateRegistry, views, setup_views
+from controller.base import BaseController
 from controller.static import BaseStaticFileHandler
 from controller.home import HomeController
 from controller.reboot import RebootController
 from controller.article import ArticleController
-from controller.list import ListController, DraftController
+from controller.list import ListController, MonthController
+from controller.list import DraftController
+from controller.search import SearchController
+from controller.feed import AtomController, RssController
+from controller.sitemap import SitemapController, RobotsController
+from controller.stats import StatsController
 from setup.setup import CloudSetupController
 from setup.setup import CloudCallbackController, CloudSuccessController
 
@@ -18,6 +28,8 @@ if __name__ == "__main__":
 
     define("port", default=8888, help="run on the given port", type=int)
     define("debug", default=0, help="debug mode", type=int)
+    define("processes", default=1,
+           help="number of server processes, 0 for one per cpu", type=int)
     tornado.options.parse_command_line()
     settings = util.settings.load_settings()
 
@@ -31,6 +43,11 @@ if __name__ == "__main__":
             format='%(asctime)s %(message)s',
             datefmt='%m/%d/%Y %I:%M:%S %p')
 
+    # parse all templates once, re-read changed ones in debug mode
+    TemplateRegistry.auto_reload = bool(options.debug)
+    views.load_all()
+    setup_views.load_all()
+
     article_url_pattern = "".join([settings['articles_url_root'], '(.+)'])
     handlers = [
         (r"/img/(.*)", BaseStaticFileHandler, {"path":"img"}),
@@ -42,12 +59,42 @@ if __name__ == "__main__":
         (r"/", HomeController),
         (article_url_pattern, ArticleController),
         (r"/list", ListController),
+        (r"/list/([0-9]+)", ListController),
+        (r"/list/([0-9]{4})/([0-9]{1,2})", MonthController),
         (r"/draft", DraftController),
+        (r"/search", SearchController),
+        (r"/feed.xml", AtomController),
+        (r"/rss.xml", RssController),
+        (r"/sitemap.xml", SitemapController),
+        (r"/sitemap-([1-9][0-9]*).xml", SitemapController),
+        (r"/robots.txt", RobotsController),
+        (r"/stats", StatsController),
         (r"/success", CloudSuccessController),
         (r"/setup", CloudSetupController),
         (r"/oauthcallback", CloudCallbackController)
         ]
     server_settings = {'debug': options.debug}
     application = tornado.web.Application(handlers, **server_settings)
-    application.listen(options.port)
+
+    processes = options.processes
+    if options.debug and processes != 1:
+        logging.warning("debug mode runs a single server process.")
+        processes = 1
+
+    if processes == 1:
+        BaseController.preload()
+        application.listen(options.port)
+    else:
+        # a server process restarted after a crash is forked with the
+        # articles loaded here, watching the stamp from before loading them
+        # makes it reload if a reboot happened since
+        BaseController.watch_reload_stamp()
+        BaseController.preload()
+        sockets = tornado.netutil.bind_sockets(options.port)
+        tornado.process.fork_processes(processes)
+        server = tornado.httpserver.HTTPServer(application)
+        server.add_sockets(sockets)
+        tornado.ioloop.PeriodicCallback(
+            BaseController.check_reload_stamp, 1000).start()
+
     tornado.ioloop.IOLoop.instance().start()
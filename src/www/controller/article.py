@@ -1,8 +1,8 @@
-from pystache.loader import Loader
-from pystache.renderer import Renderer
 import tornado
 
 from base import BaseController
+from page import CachedPage
+from util.templates import views
 
 
 class ArticleController(BaseController):
@@ -11,49 +11,43 @@ class ArticleController(BaseController):
 
         article_name = article_name.lower()
 
-        if article_name in BaseController.articles:
+        if article_name in self.snapshot.articles:
 
-            article = BaseController.articles[article_name]
+            article = self.snapshot.articles[article_name]
+            hits = BaseController.article_hits
+            hits[article_name] = hits.get(article_name, 0) + 1
 
-            # if content has not modified since last request
-            # send a 304 not modified status
-            modified_header_key = "If-Modified-Since"
-            if modified_header_key in self.request.headers:
-                if (self.request.headers["If-Modified-Since"] ==
-                    article['modified_date']):
-                    self.set_status(304)
-                    return
+            page = None
+            if self.snapshot.settings['enable_caching']:
+                page = self.snapshot.cached_articles.get(article_name)
 
-            if (BaseController.settings['enable_caching'] and
-                article_name in BaseController.cached_articles):
-                html = BaseController.cached_articles[article_name]
-            else:
-                view_model = {
-                "article": article,
-                "site_name": BaseController.settings['site_name']
-                }
-                self.attach_meta_data(view_model)
-
-                loader = Loader(file_encoding='utf8',
-                                extension='html',
-                                search_dirs=['view', ])
-                renderer = Renderer(file_encoding='utf8',
-                                    file_extension='html',
-                                    search_dirs=['view/partials'])
-                template = loader.load_name('article')
-                html = renderer.render(template, view_model)
+            if page is None:
+                page = self.render_page(self.snapshot, article)
 
                 # cache the html
-                BaseController.cached_articles[article_name] = html
+                self.snapshot.cached_articles.put(article_name, page,
+                                                  page.size)
 
             # set http caching headers
-            if "http_caching_max_age" in BaseController.settings:
-                max_age = BaseController.settings["http_caching_max_age"]
+            if "http_caching_max_age" in self.snapshot.settings:
+                max_age = self.snapshot.settings["http_caching_max_age"]
             else:
                 max_age = 60
             self.set_header("Cache-control", "max-age=%s" % max_age)
-            self.set_header("Last-Modified", article['modified_date'])
-            self.write(html)
+
+            # answers If-None-Match and If-Modified-Since with a 304
+            self.write_page(page)
 
         else:
             raise tornado.web.HTTPError(404)
+
+    @classmethod
+    def render_page(cls, snapshot, article):
+        """Render the page of an article in a snapshot."""
+        view_model = {
+        "article": article,
+        "site_name": snapshot.settings['site_name']
+        }
+        cls.attach_meta_data(view_model, snapshot.settings)
+        html = views.render('article', view_model)
+        return CachedPage(html, article.modified_time)
@@ -1,27 +1,159 @@
 from datetime import datetime
 import glob
+import hashlib
 import logging
 import operator
 import os
 import re
+import threading
 import time
 import traceback
 
 import tornado.web
 import markdown2
 
+from page import CachedPage
 import util.settings
+from util import render_cache
+from util import store_file
+from util.article import Article, LazyContent, content_cache, last_modified
+from util.lru_cache import LRUCache
+from util.search import SearchIndex
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+
+
+# touched to make every server process reload its articles
+_RELOAD_STAMP = "_store/reload.stamp"
+
+
+class Snapshot(object):
+    """Articles loaded from disk and the pages rendered from them.
+
+    A published snapshot is never modified, except for filling its page
+    cache. Reloading builds a new snapshot and swaps it in, so a request
+    is served from the snapshot it started with.
+    """
+
+    def __init__(self, settings, manifest=None, articles=None):
+        self.settings = settings
+        self.manifest = manifest or {}
+        self.articles = articles or {}
+        self.search_index = SearchIndex()
+        page_cache_size = settings.get('page_cache_size') or 64
+        self.cached_articles = LRUCache(page_cache_size * 1024 * 1024)
+        self.cached_home = None
+        self.cached_list = {}
+        self.cached_feeds = {}
+        self.cached_sitemaps = {}
+
+        # pages rendered in this snapshot are dated no earlier, see
+        # `dated_page`
+        self.build_time = time.time()
+
+        # (content hash, last modified) of pages of earlier snapshots by
+        # page key
+        self.page_dates = {}
+
+        self._build_indexes()
+
+    def _build_indexes(self):
+        """Build the article orderings pages are sliced from."""
+
+        # published articles, newest first
+        self.published = sorted((article for article in self.articles.values()
+                                 if article.date is not None),
+                                key=operator.attrgetter('date'),
+                                reverse=True)
+
+        # drafts, most recently edited first
+        self.drafts = sorted((article for article in self.articles.values()
+                              if article.date is None),
+                             key=operator.attrgetter('modified_time'),
+                             reverse=True)
+
+        # published articles by (year, month), newest first
+        self.by_month = {}
+        for article in self.published:
+            month = (article.date.year, article.date.month)
+            self.by_month.setdefault(month, []).append(article)
+
+        # latest modified time of the published articles
+        self.last_modified = last_modified(self.published)
+
+    def home_articles(self):
+        """Get the articles shown on the home page.
+
+        Returns:
+            Tuple of the articles and whether there are more.
+        """
+        max_articles = self.settings['homepage_max_articles']
+        return (self.published[:max_articles],
+                len(self.published) > max_articles)
+
+    def list_page_count(self):
+        """Get the number of list pages, there is always at least one."""
+        page_size = self.settings.get("list_page_size") or 50
+        return max(1, (len(self.published) + page_size - 1) // page_size)
+
+    def list_articles(self, page_number):
+        """Get the articles of a list page.
+
+        Returns:
+            Tuple of the articles and whether there are older ones.
+        """
+        page_size = self.settings.get("list_page_size") or 50
+        start = (page_number - 1) * page_size
+        return (self.published[start:start + page_size],
+                page_number < self.list_page_count())
+
+    def feed_articles(self):
+        """Get the articles in the feeds."""
+        max_articles = self.settings.get("feed_max_articles") or 20
+        return self.published[:max_articles]
+
+    def dated_page(self, key, html, articles):
+        """Create the cached page of a page showing several articles.
+
+        The latest modified time of the articles does not do as the page's
+        Last-Modified, it goes back when that article leaves the page. The
+        date only moves forward instead: a page unchanged since an earlier
+        snapshot keeps its date, a changed page is dated after the earlier
+        version and no earlier than the build of this snapshot.
+
+        Args:
+            key: Key of the page in `page_dates`.
+            html: Rendered page.
+            articles: Articles shown on the page.
+        """
+        page = CachedPage(html)
+        prev = self.page_dates.get(key)
+        if prev is not None and prev[0] == page.content_hash:
+            page.last_modified = prev[1]
+        else:
+            dates = [self.build_time, last_modified(articles) or 0]
+            if prev is not None:
+                dates.append(prev[1] + 1)
+            page.last_modified = max(dates)
+        return page
 
 
 class BaseController(tornado.web.RequestHandler):
     """Base class for all controllers in the application."""
 
     settings = {}
-    articles = []
-    cached_home = None
-    cached_list = None
-    cached_articles = {}
+    snapshot = Snapshot({})
     initialized = False
+    reloading = False
+    reload_pending = False
+    reload_lock = threading.Lock()
+    reload_stamp_mtime = None
+
+    # requests per article since the process started
+    article_hits = {}
 
     def prepare(self):
         """Called at the beginning of a request before `get`/`post`/etc.
@@ -32,6 +164,9 @@ class BaseController(tornado.web.RequestHandler):
             self._boot()
             BaseController.initialized = True
 
+        # serve the whole request from the same snapshot
+        self.snapshot = BaseController.snapshot
+
     def write_error(self, status_code, exc_info=None, **kwargs):
         """Write error message.
 
@@ -45,28 +180,234 @@ class BaseController(tornado.web.RequestHandler):
             logging.error("%s\n\n" % tb)
             self.redirect("/static/error.html")
 
-    def log_error(self):
+    @staticmethod
+    def log_error():
         tb = traceback.format_exc()
         logging.error(tb)
 
     def _boot(self):
-        """Boot the application, load settings and articles."""
-        BaseController.settings = util.settings.load_settings()
+        """Boot the server process, the articles are loaded by `preload`.
+
+        Worker threads do not survive forking, so the content warmer is
+        started here in each server process.
+        """
+        BaseController.start_content_warmer(BaseController.snapshot)
         self._validate_settings()
-        self._load_articles()
+
+    @classmethod
+    def preload(cls):
+        """Load settings and articles before the server starts listening.
+
+        The first request is not held up by loading, and server processes
+        forked afterwards start with the loaded articles instead of loading
+        them again. Their memory is shared copy-on-write, pages get copied
+        as reference counts of the objects on them change.
+        """
+        snapshot = cls.build_snapshot(cls.snapshot)
+        cls._warm_up(snapshot)
+        cls._publish(snapshot)
 
     def _validate_settings(self):
         """Validates settings from settings.conf"""
         if not BaseController.settings['pass_phrase']:
             self.redirect("/static/configure.html")
 
-    def _load_articles(self):
-        """Load all articles."""
+    @classmethod
+    def reload(cls):
+        """Rebuild the articles in a worker thread.
+
+        Requests keep being served from the current snapshot until the new
+        one is published. A reload requested while another one is running
+        is carried out once the running one finishes.
+        """
+        with cls.reload_lock:
+            if cls.reloading:
+                cls.reload_pending = True
+                return
+            cls.reloading = True
+
+        worker = threading.Thread(target=cls._reload_worker)
+        worker.daemon = True
+        worker.start()
+
+    @classmethod
+    def request_reload(cls):
+        """Reload the articles in every server process.
+
+        A reboot request reaches only one of several server processes, the
+        others are told by touching the reload stamp they watch.
+        """
+        if cls.reload_stamp_mtime is None:
+            cls.reload()
+            return
 
-        if not BaseController.settings:
+        folder = os.path.dirname(_RELOAD_STAMP)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(_RELOAD_STAMP, 'a'):
+            os.utime(_RELOAD_STAMP, None)
+
+    @classmethod
+    def watch_reload_stamp(cls):
+        """Start watching the reload stamp, see `check_reload_stamp`."""
+        cls.reload_stamp_mtime = _stamp_mtime()
+
+    @classmethod
+    def check_reload_stamp(cls):
+        """Reload if the reload stamp was touched since the last check."""
+        mtime = _stamp_mtime()
+        if mtime != cls.reload_stamp_mtime:
+            cls.reload_stamp_mtime = mtime
+            cls.reload()
+
+    @classmethod
+    def _reload_worker(cls):
+        while True:
+            try:
+                snapshot = cls.build_snapshot(cls.snapshot)
+                if snapshot.settings:
+                    cls._warm_up(snapshot)
+                    cls._publish(snapshot)
+                    cls.start_content_warmer(snapshot)
+            except Exception:
+                cls.log_error()
+
+            with cls.reload_lock:
+                if not cls.reload_pending:
+                    cls.reloading = False
+                    return
+                cls.reload_pending = False
+
+    @classmethod
+    def _warm_up(cls, snapshot):
+        """Render the pages of a snapshot likely requested first."""
+        if not snapshot.settings or not snapshot.settings['enable_caching']:
             return
 
-        settings = BaseController.settings
+        # imported here, the controllers import this module
+        from warmup import warm_up
+
+        # halve the request counts at each reload, so the counts reflect
+        # recent requests
+        hits = cls.article_hits
+        cls.article_hits = dict((key, count // 2)
+                                for key, count in hits.items() if count > 1)
+        try:
+            warm_up(snapshot, hits)
+        except Exception:
+            cls.log_error()
+
+    @classmethod
+    def start_content_warmer(cls, snapshot):
+        """Render lazily rendered content in a worker thread.
+
+        The most requested articles are rendered first, newer ones first
+        among equally requested, while they fit in the content cache.
+        """
+        if not snapshot.settings.get('lazy_content_cache_size'):
+            return
+
+        worker = threading.Thread(target=cls._warm_content, args=(snapshot,))
+        worker.daemon = True
+        worker.start()
+
+    @classmethod
+    def _warm_content(cls, snapshot):
+        hits = dict(cls.article_hits)
+        root_length = len(snapshot.settings['articles_url_root'])
+
+        def popularity(article):
+            return hits.get(article.url[root_length:], 0)
+
+        # published articles are newest first, sorting keeps that order
+        # among equally requested ones
+        articles = sorted(snapshot.published, key=popularity, reverse=True)
+
+        # rendered until the next one would not fit in the room left, so
+        # warming never evicts content already cached
+        room = content_cache.max_size - content_cache.size
+        rendered = []
+        for article in articles:
+            if snapshot is not cls.snapshot:
+                return
+            if not article.lazy or article.content_hash in content_cache:
+                continue
+            try:
+                content, current = article.render()
+            except Exception:
+                cls.log_error()
+                continue
+            if not current:
+                continue
+            if len(content) > room:
+                break
+            room -= len(content)
+            rendered.append((article.content_hash, content))
+
+        # least requested first, so the most requested are evicted last
+        for content_hash, content in reversed(rendered):
+            content_cache.put(content_hash, content, len(content))
+
+    @classmethod
+    def _publish(cls, snapshot):
+        cls.snapshot = snapshot
+        cls.settings = snapshot.settings
+
+    @classmethod
+    def build_snapshot(cls, prev=None):
+        """Load settings and articles into a new snapshot.
+
+        Args:
+            prev: Snapshot to reuse parsed articles and cached pages from.
+        """
+        if prev is None:
+            prev = Snapshot({})
+
+        # None if settings.conf could not be read, e.g. while rewritten
+        settings = util.settings.load_settings()
+        if not settings:
+            return Snapshot({})
+
+        # settings feed into every parsed article and rendered page, so a
+        # change in settings invalidates everything loaded so far
+        if settings != prev.settings:
+            prev = Snapshot(settings)
+
+        content_cache.max_size = (
+            (settings.get('lazy_content_cache_size') or 0) * 1024 * 1024)
+        render_cache.max_size = (
+            (settings.get('render_cache_size') or 0) * 1024 * 1024)
+
+        # start from the articles loaded and indexed by the previous run
+        prev_manifest = prev.manifest
+        prev_index = prev.search_index
+        if settings.get('loader_snapshot') and not prev_manifest:
+            prev_manifest, prev_index = store_file.read(settings)
+
+        manifest, articles = cls._load_articles(settings, prev_manifest)
+
+        snapshot = Snapshot(settings, manifest, articles)
+        snapshot.search_index = cls._update_search_index(prev_index, snapshot)
+
+        if settings.get('loader_snapshot') and (
+                len(manifest) != len(prev_manifest) or
+                any(entry is not prev_manifest.get(file_name)
+                    for file_name, entry in manifest.items())):
+            store_file.write(settings, manifest, snapshot.search_index)
+
+        cls._carry_over_cache(prev, snapshot)
+        return snapshot
+
+    @classmethod
+    def _load_articles(cls, settings, prev_manifest):
+        """Load all articles.
+
+        Only files which were added or changed since the previous load are
+        parsed again, everything else is taken from the manifest.
+
+        Returns:
+            Tuple of the new manifest and the articles keyed by url.
+        """
 
         live_articles = []
         draft_articles = []
@@ -75,110 +416,318 @@ class BaseController(tornado.web.RequestHandler):
         path = "".join([root_folder, settings['articles_file_extension']])
         files = glob.glob(path)
 
+        manifest = {}
+        changed_files = []
+
         for file_name in files:
             try:
-                stream = open(file_name, 'r')
-                lines = stream.readlines()
-
-                # atleast 3 lines should be in the article file
-                # 1st line = title
-                # 2nd line = ------
-                # 3rd line = content
-                if len(lines) >= 3:
-
-                    title = lines[0]
-
-                    match = re.search('\[(.{1,2}/.{1,2}/.{2,4})\]', title)
-
-                    if match:
-                        published_date_string = match.group(1)
-                        date_parts = published_date_string.split('/')
-
-                        # 4 digit year should be greater than 1900
-                        if (len(date_parts[2]) == 4 and
-                                int(date_parts[2]) > 1900):
-                            published_date = datetime.strptime(
-                                published_date_string, '%m/%d/%Y')
-                        # 2 digit year
-                        elif len(date_parts[2]) == 2:
-                            published_date = datetime.strptime(
-                                    published_date_string, '%m/%d/%y')
-                        else:
-                            logging.warning('skipping article: %s' %
-                                            title.strip())
-                            continue
-
-                        published_date_string = self._custom_strftime(
-                                                '%B {S}, %Y',
-                                                published_date)
-
-                        title = title[match.end():].strip()
-
-                    else:
-                        title = title.strip()
-                        published_date_string = ''
-                        published_date = None
-
-                    summary_lines = settings['homepage_summary_lines']
-
-                    if len(lines) > summary_lines + 3:
-                        summary = ''.join(lines[2:summary_lines]).strip()
-                    else:
-                        summary = ''.join(lines[2:]).strip()
-
-                    # convert summary markdown to html
-                    summary = markdown2.markdown(summary)
-
-                    # convert content markdown to html
-                    content = ''.join(lines[2:])
-                    content = markdown2.markdown(content)
-
-                    # get modified date
-                    modified_date = time.ctime(os.path.getmtime(file_name))
-
-                    article = {
-                                'url': '',
-                                'date': published_date,
-                                'dateString': published_date_string,
-                                'title': title,
-                                'summary': summary,
-                                'content': content,
-                                'modified_date': modified_date
-                              }
-
-                    if article['date'] is None:
-                        draft_articles.append(article)
-                    else:
-                        live_articles.append(article)
-
+                prev_entry = prev_manifest.get(file_name)
+                if cls._is_unchanged(file_name, prev_entry):
+                    manifest[file_name] = prev_entry
+                else:
+                    changed_files.append(file_name)
             except Exception:
-                self.log_error()
+                cls.log_error()
+
+        entries = cls._load_files(settings, changed_files, prev_manifest)
+        for file_name, entry in zip(changed_files, entries):
+            if entry is None:
+                continue
+
+            # touched but not changed, the parsed article is reused
+            if 'article' not in entry:
+                article = prev_manifest[file_name]['article']
+                if article is not None:
+                    article = article.copy(modified_time=entry['mtime'])
+                entry['article'] = article
+            manifest[file_name] = entry
+
+        # keep the render cache within its size once new entries went in
+        if changed_files and render_cache.max_size:
+            render_cache.evict(render_cache.max_size)
+
+        for file_name in files:
+            if file_name not in manifest:
+                continue
+
+            article = manifest[file_name]['article']
+            if article is None:
+                continue
+            elif article.date is None:
+                draft_articles.append(article)
+            else:
+                live_articles.append(article)
 
         articles_store = {}
 
         # live articles
         sorted_articles = sorted(live_articles,
-                                key=operator.itemgetter('date'),
+                                key=operator.attrgetter('date'),
                                 reverse=False)
         for article in sorted_articles:
-            self._add_article(article, articles_store)
+            cls._add_article(article.copy(), articles_store, settings)
 
         # draft articles
         for article in draft_articles:
-            self._add_article(article, articles_store)
+            cls._add_article(article.copy(), articles_store, settings)
 
-        # publish the articles
-        BaseController.articles = articles_store
+        return manifest, articles_store
 
-        # clear cached articles
-        BaseController.cached_articles = {}
-        BaseController.cached_home = None
-        BaseController.cached_list = None
+    @classmethod
+    def _is_unchanged(cls, file_name, prev_entry):
+        """Check the file against its manifest entry by mtime and size."""
+        if prev_entry is None:
+            return False
 
-    def _add_article(self, article, articles_store):
-        """Add and generate unique URL for the article."""
+        stat = os.stat(file_name)
+        return (prev_entry['mtime'] == stat.st_mtime and
+                prev_entry['size'] == stat.st_size)
+
+    @classmethod
+    def _load_files(cls, settings, file_names, prev_manifest):
+        """Load manifest entries of article files.
+
+        Files are read and parsed in a pool of `loader_processes` worker
+        processes when configured, otherwise one after the other.
+
+        Only the previous content hashes are sent to the worker processes,
+        articles are pickled with their content.
+
+        Returns:
+            List of manifest entries in the order of `file_names`, None for
+            files which failed to load. Entries of files whose content hash
+            did not change have no article.
+        """
+        prev_hashes = []
+        for file_name in file_names:
+            prev_entry = prev_manifest.get(file_name)
+            prev_hashes.append(prev_entry['hash'] if prev_entry else None)
+        settings_list = [settings] * len(file_names)
+
+        processes = settings.get('loader_processes') or 0
+        if processes > 1 and ProcessPoolExecutor is None:
+            logging.warning('loader_processes needs concurrent.futures, '
+                            'loading articles serially')
+            processes = 0
+
+        if processes < 2 or len(file_names) < 2:
+            return map(_load_file, settings_list, file_names, prev_hashes)
+
+        executor = ProcessPoolExecutor(max_workers=processes)
+        try:
+            return list(executor.map(_load_file, settings_list, file_names,
+                                     prev_hashes))
+        finally:
+            executor.shutdown()
+
+    @classmethod
+    def _load_manifest_entry(cls, settings, file_name, prev_hash):
+        """Read an article file and build its manifest entry.
+
+        The file is parsed only if its content hash changed.
+
+        Args:
+            settings: Application settings.
+            file_name: Path to the article file.
+            prev_hash: Content hash from the previous load or None.
+
+        Returns:
+            Manifest entry with mtime, size, hash and the parsed article.
+            The article is left out if the hash equals `prev_hash`.
+        """
+        stat = os.stat(file_name)
+
+        stream = open(file_name, 'r')
+        try:
+            lines = stream.readlines()
+        finally:
+            stream.close()
+
+        content_hash = hashlib.sha1(''.join(lines)).hexdigest()
+
+        entry = {
+                 'mtime': stat.st_mtime,
+                 'size': stat.st_size,
+                 'hash': content_hash
+                }
+        if content_hash != prev_hash:
+            entry['article'] = cls._parse_article(settings, file_name, lines,
+                                                  stat.st_mtime, content_hash)
+        return entry
+
+    @classmethod
+    def _parse_article(cls, settings, file_name, lines, modified_time,
+                       content_hash):
+        """Parse lines of an article file.
+
+        Rendered html is taken from the render cache when enabled. With
+        `lazy_content_cache_size` set only the summary is rendered, the
+        content is rendered when it is first needed.
+
+        Returns:
+            Article without url, or None if the file is not an article.
+        """
+
+        # atleast 3 lines should be in the article file
+        # 1st line = title
+        # 2nd line = ------
+        # 3rd line = content
+        if len(lines) < 3:
+            return None
+
+        title = lines[0]
+
+        match = re.search('\[(.{1,2}/.{1,2}/.{2,4})\]', title)
+
+        if match:
+            published_date_string = match.group(1)
+            date_parts = published_date_string.split('/')
+
+            # 4 digit year should be greater than 1900
+            if (len(date_parts[2]) == 4 and
+                    int(date_parts[2]) > 1900):
+                published_date = datetime.strptime(
+                    published_date_string, '%m/%d/%Y')
+            # 2 digit year
+            elif len(date_parts[2]) == 2:
+                published_date = datetime.strptime(
+                        published_date_string, '%m/%d/%y')
+            else:
+                logging.warning('skipping article: %s' %
+                                title.strip())
+                return None
+
+            published_date_string = cls._custom_strftime(
+                                    '%B {S}, %Y',
+                                    published_date)
+
+            title = title[match.end():].strip()
+
+        else:
+            title = title.strip()
+            published_date_string = ''
+            published_date = None
+
+        summary_lines = settings['homepage_summary_lines']
+        lazy = bool(settings.get('lazy_content_cache_size'))
+
+        cache_key = None
+        cached = None
+        if settings.get('render_cache_size'):
+            cache_key = render_cache.make_key(content_hash, summary_lines)
+            cached = render_cache.get(cache_key)
+
+        if cached is not None:
+            summary, content = cached
+        else:
+            if len(lines) > summary_lines + 3:
+                summary = ''.join(lines[2:summary_lines]).strip()
+            else:
+                summary = ''.join(lines[2:]).strip()
+
+            # convert summary markdown to html
+            summary = markdown2.markdown(summary)
+
+            if not lazy:
+                # convert content markdown to html
+                content = ''.join(lines[2:])
+                content = markdown2.markdown(content)
 
-        settings = BaseController.settings
+                if cache_key is not None:
+                    render_cache.put(cache_key, summary, content)
+
+        if lazy:
+            content = LazyContent(file_name, content_hash, summary, cache_key)
+
+        return Article(published_date, published_date_string, title, summary,
+                       content, modified_time, content_hash)
+
+    @classmethod
+    def _carry_over_cache(cls, prev, snapshot):
+        """Copy cached pages of `prev` which are still valid for `snapshot`.
+
+        A page is kept unless the articles it shows changed, so an edited
+        article evicts only the pages showing it and drafts evict none but
+        their own.
+
+        The dates of the pages of `prev` are kept, so a page rendered again
+        keeps its Last-Modified if unchanged and is dated after it if not.
+        """
+        dates = dict(prev.page_dates)
+        prev_pages = [('home', prev.cached_home)]
+        prev_pages.extend((('list', key), page)
+                          for key, page in prev.cached_list.items())
+        prev_pages.extend((('feed', name), page)
+                          for name, page in prev.cached_feeds.items())
+        prev_pages.extend((('sitemap', key), page)
+                          for key, page in prev.cached_sitemaps.items()
+                          if key != 'robots')
+        for key, page in prev_pages:
+            if page is not None:
+                dates[key] = (page.content_hash, page.last_modified)
+        snapshot.page_dates = dates
+
+        # article pages whose article did not change, move or disappear
+        pages = snapshot.cached_articles
+        for url, page, size in prev.cached_articles.items():
+            if prev.articles.get(url) == snapshot.articles.get(url):
+                pages.put(url, page, size)
+
+        # counters cover the life time of the process
+        pages.hits += prev.cached_articles.hits
+        pages.misses += prev.cached_articles.misses
+        pages.evictions += prev.cached_articles.evictions
+
+        if prev.home_articles() == snapshot.home_articles():
+            snapshot.cached_home = prev.cached_home
+
+        # list pages by page number and month pages by (year, month)
+        for key, page in list(prev.cached_list.items()):
+            if isinstance(key, tuple):
+                unchanged = (prev.by_month.get(key) ==
+                             snapshot.by_month.get(key))
+            else:
+                unchanged = (prev.list_articles(key) ==
+                             snapshot.list_articles(key))
+            if unchanged:
+                snapshot.cached_list[key] = page
+
+        if prev.feed_articles() == snapshot.feed_articles():
+            snapshot.cached_feeds = dict(prev.cached_feeds)
+
+        # sitemaps list every published article, robots.txt none
+        if prev.published == snapshot.published:
+            snapshot.cached_sitemaps = dict(prev.cached_sitemaps)
+        elif 'robots' in prev.cached_sitemaps:
+            snapshot.cached_sitemaps['robots'] = prev.cached_sitemaps['robots']
+
+    @classmethod
+    def _update_search_index(cls, prev_index, snapshot):
+        """Index the published articles of `snapshot`.
+
+        `prev_index` is copied and only articles which were added, changed
+        or removed since are analyzed. Articles are indexed with their
+        content hash as version, the title is part of the content.
+        """
+        index = prev_index.copy()
+
+        for key in index.keys():
+            article = snapshot.articles.get(key)
+            if (article is None or article.date is None or
+                    article.content_hash != index.version(key)):
+                index.remove(key)
+
+        for article in snapshot.published:
+            key = article.url[len(snapshot.settings['articles_url_root']):]
+            if key not in index:
+                index.add(key, article.title, article.text(),
+                          article.content_hash)
+
+        return index
+
+    @classmethod
+    def _add_article(cls, article, articles_store, settings):
+        """Add and generate unique URL for the article."""
 
         # check if we have any url maps defined in settings
         if 'url_map' in settings:
@@ -187,7 +736,7 @@ class BaseController(tornado.web.RequestHandler):
             url_map = None
 
         # generate url based on the title
-        title = article['title']
+        title = article.title
         ignore_pattern = '[^\w\s]'
         original_url = re.sub(ignore_pattern, '', title)
         original_url = original_url.replace(' ', '-').lower()
@@ -205,14 +754,16 @@ class BaseController(tornado.web.RequestHandler):
             else:
                 break
 
-        article['url'] = "".join([settings['articles_url_root'], url])
+        article.url = "".join([settings['articles_url_root'], url])
         articles_store[url] = article
 
-    def _custom_strftime(self, format, t):
+    @classmethod
+    def _custom_strftime(cls, format, t):
         """Generate date string with st, nd, rd, th suffix"""
-        return t.strftime(format).replace('{S}', str(t.day) + self._date_suffix(t.day))
+        return t.strftime(format).replace('{S}', str(t.day) + cls._date_suffix(t.day))
 
-    def _date_suffix(self, d):
+    @classmethod
+    def _date_suffix(cls, d):
         if 11 <= d <= 13:
             return 'th'
         else:
@@ -221,6 +772,30 @@ class BaseController(tornado.web.RequestHandler):
     def compute_etag(self):
         return None
 
+    def write_page(self, page):
+        """Write a cached page.
+
+        Conditional requests matching the page are answered with 304,
+        otherwise the page is sent compressed if the client accepts it.
+        """
+        accept_encoding = self.request.headers.get("Accept-Encoding", "")
+        encoding, body = page.select(accept_encoding)
+
+        self.set_header("Vary", "Accept-Encoding")
+        self.set_header("Etag", page.etag(encoding))
+        if page.last_modified is not None:
+            self.set_header("Last-Modified",
+                            datetime.utcfromtimestamp(page.last_modified))
+
+        if page.is_not_modified(self.request.headers.get("If-None-Match"),
+                                self.request.headers.get("If-Modified-Since")):
+            self.set_status(304)
+            return
+
+        if encoding:
+            self.set_header("Content-Encoding", encoding)
+        self.write(body)
+
     def authenticate_request(self):
         pass_phrase = self.get_argument("pass", None)
         if (pass_phrase is not None and
@@ -229,17 +804,39 @@ class BaseController(tornado.web.RequestHandler):
         else:
             raise tornado.web.HTTPError(403)
 
-    def attach_meta_data(self, obj):
+    @classmethod
+    def attach_meta_data(cls, obj, settings):
         """Adds misc. properties from configuration."""
 
-        if "email" in BaseController.settings:
-            obj["email"] = BaseController.settings["email"]
+        if "email" in settings:
+            obj["email"] = settings["email"]
 
-        if "twitter_username" in BaseController.settings:
-            obj["twitter"] = BaseController.settings["twitter_username"]
+        if "twitter_username" in settings:
+            obj["twitter"] = settings["twitter_username"]
+
+        if "github_username" in settings:
+            obj["github"] = settings["github_username"]
+
+        if "coderwall_username" in settings:
+            obj["coderwall"] = settings["coderwall_username"]
+
+
+def _load_file(settings, file_name, prev_hash):
+    """Load the manifest entry of an article file.
+
+    Defined at module level so that it can be run in loader processes.
+    """
+    try:
+        return BaseController._load_manifest_entry(settings, file_name,
+                                                   prev_hash)
+    except Exception:
+        BaseController.log_error()
+        return None
 
-        if "github_username" in BaseController.settings:
-            obj["github"] = BaseController.settings["github_username"]
 
-        if "coderwall_username" in BaseController.settings:
-            obj["coderwall"] = BaseController.settings["coderwall_username"]
+def _stamp_mtime():
+    try:
+        return os.path.getmtime(_RELOAD_STAMP)
+    except OSError:
+        # never touched
+        return 0
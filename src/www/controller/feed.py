@@ -0,0 +1,135 @@
+import calendar
+import email.utils
+import time
+from xml.sax.saxutils import escape, quoteattr
+
+from base import BaseController
+from util.article import last_modified
+
+
+class FeedController(BaseController):
+    """Base class for feeds of the latest published articles.
+
+    A feed is rendered once per snapshot and served from the feed cache,
+    conditional requests of feed readers are answered with 304.
+    """
+
+    feed_name = None
+    content_type = None
+
+    def get(self):
+
+        if (self.snapshot.settings['enable_caching'] and
+            self.feed_name in self.snapshot.cached_feeds):
+            page = self.snapshot.cached_feeds[self.feed_name]
+        else:
+            page = self.render_page(self.snapshot)
+
+            # cache the feed
+            self.snapshot.cached_feeds[self.feed_name] = page
+
+        self.set_header("Content-Type", self.content_type)
+        self.write_page(page)
+
+    @classmethod
+    def render_page(cls, snapshot):
+        """Render the feed of a snapshot."""
+        articles = snapshot.feed_articles()
+        updated = last_modified(articles)
+        site_url = snapshot.settings["site_url"].rstrip('/')
+        xml = cls.render_feed(snapshot, site_url, articles, updated)
+        return snapshot.dated_page(('feed', cls.feed_name), xml, articles)
+
+    @classmethod
+    def render_feed(cls, snapshot, site_url, articles, updated):
+        raise NotImplementedError()
+
+
+class AtomController(FeedController):
+
+    feed_name = 'atom'
+    content_type = "application/atom+xml; charset=UTF-8"
+
+    @classmethod
+    def render_feed(cls, snapshot, site_url, articles, updated):
+        site_name = _text(snapshot.settings["site_name"])
+        xml = [u'<?xml version="1.0" encoding="utf-8"?>',
+               u'<feed xmlns="http://www.w3.org/2005/Atom">',
+               u'<title>%s</title>' % escape(site_name),
+               u'<link href=%s/>' % quoteattr(site_url + '/'),
+               u'<link rel="self" href=%s/>' % quoteattr(site_url +
+                                                        '/feed.xml'),
+               u'<id>%s/</id>' % escape(site_url),
+               u'<updated>%s</updated>' % _atom_date(updated),
+               u'<author><name>%s</name></author>' % escape(site_name)]
+
+        for article in articles:
+            url = site_url + article.url
+            published = calendar.timegm(article.date.timetuple())
+            xml.extend([
+                u'<entry>',
+                u'<title>%s</title>' % escape(_text(article.title)),
+                u'<link href=%s/>' % quoteattr(url),
+                u'<id>%s</id>' % escape(url),
+                u'<published>%s</published>' % _atom_date(published),
+                u'<updated>%s</updated>' % _atom_date(
+                    article.modified_time),
+                u'<summary type="html">%s</summary>' % escape(
+                    _text(article.summary)),
+                u'<content type="html">%s</content>' % escape(
+                    _text(article.content)),
+                u'</entry>'])
+
+        xml.append(u'</feed>')
+        return u'\n'.join(xml)
+
+
+class RssController(FeedController):
+
+    feed_name = 'rss'
+    content_type = "application/rss+xml; charset=UTF-8"
+
+    @classmethod
+    def render_feed(cls, snapshot, site_url, articles, updated):
+        site_name = _text(snapshot.settings["site_name"])
+        xml = [u'<?xml version="1.0" encoding="utf-8"?>',
+               u'<rss version="2.0">',
+               u'<channel>',
+               u'<title>%s</title>' % escape(site_name),
+               u'<link>%s/</link>' % escape(site_url),
+               u'<description>%s</description>' % escape(site_name),
+               u'<lastBuildDate>%s</lastBuildDate>' % _rss_date(updated)]
+
+        for article in articles:
+            url = site_url + article.url
+            published = calendar.timegm(article.date.timetuple())
+            xml.extend([
+                u'<item>',
+                u'<title>%s</title>' % escape(_text(article.title)),
+                u'<link>%s</link>' % escape(url),
+                u'<guid isPermaLink="true">%s</guid>' % escape(url),
+                u'<pubDate>%s</pubDate>' % _rss_date(published),
+                u'<description>%s</description>' % escape(
+                    _text(article.content)),
+                u'</item>'])
+
+        xml.extend([u'</channel>', u'</rss>'])
+        return u'\n'.join(xml)
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def _atom_date(timestamp):
+    if timestamp is None:
+        timestamp = 0
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def _rss_date(timestamp):
+    if timestamp is None:
+        timestamp = 0
+    return email.utils.formatdate(timestamp, usegmt=True)
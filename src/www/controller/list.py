@@ -1,67 +1,95 @@
-import operator
-
-from pystache.loader import Loader
-from pystache.renderer import Renderer
 import tornado
 
 from base import BaseController
+from util.templates import views
 
 
 class ListController(BaseController):
 
-    def get(self):
+    def get(self, page_number=None):
+
+        if page_number is None:
+            page_number = self.get_argument("page", "1")
+        try:
+            page_number = int(page_number)
+        except ValueError:
+            raise tornado.web.HTTPError(404)
+
+        if page_number < 1 or page_number > self.snapshot.list_page_count():
+            raise tornado.web.HTTPError(404)
 
-        if (BaseController.settings['enable_caching'] and
-            BaseController.cached_list):
-                html = BaseController.cached_list
-                self.write(html)
+        if (self.snapshot.settings['enable_caching'] and
+            page_number in self.snapshot.cached_list):
+                page = self.snapshot.cached_list[page_number]
         else:
-            articles = self._get_articles()
-            html = self.generate_page(articles)
+            page = self.render_page(self.snapshot, page_number)
 
             # cache the page
-            BaseController.cached_list = html
+            self.snapshot.cached_list[page_number] = page
 
-            self.write(html)
+        self.write_page(page)
+
+    @classmethod
+    def page_url(cls, page_number):
+        if page_number == 1:
+            return "/list"
+        return "/list/%d" % page_number
+
+    @classmethod
+    def render_page(cls, snapshot, page_number=1):
+        """Render a page of the list of published articles of a snapshot."""
+        articles, has_older = snapshot.list_articles(page_number)
+
+        pagination = {}
+        if page_number > 1:
+            pagination["newer_url"] = cls.page_url(page_number - 1)
+        if has_older:
+            pagination["older_url"] = cls.page_url(page_number + 1)
 
-    def generate_page(self, articles):
+        html = cls.generate_page(snapshot, articles, pagination or None)
+        return snapshot.dated_page(('list', page_number), html, articles)
+
+    @classmethod
+    def generate_page(cls, snapshot, articles, pagination=None):
         view_model = {
                     "articles": articles,
-                    "site_name": BaseController.settings["site_name"]
+                    "pagination": pagination,
+                    "site_name": snapshot.settings["site_name"]
                     }
-        self.attach_meta_data(view_model)
-
-        loader = Loader(file_encoding='utf8', extension='html',
-                        search_dirs=['view', ])
-        renderer = Renderer(file_encoding='utf8', file_extension='html',
-                            search_dirs=['view/partials'])
-        template = loader.load_name('list')
-        html = renderer.render(template, view_model)
-        return html
-
-    def _get_articles(self, draft=False):
-        article_list = []
-        if draft:
-            for article in BaseController.articles.values():
-                if article['date'] is None:
-                    article_list.append(article)
+        cls.attach_meta_data(view_model, snapshot.settings)
+        return views.render('list', view_model)
+
+
+class MonthController(ListController):
+    """Lists the articles published in a month."""
+
+    def get(self, year, month):
+
+        month = (int(year), int(month))
+        if month not in self.snapshot.by_month:
+            raise tornado.web.HTTPError(404)
+
+        if (self.snapshot.settings['enable_caching'] and
+            month in self.snapshot.cached_list):
+                page = self.snapshot.cached_list[month]
         else:
-            for article in BaseController.articles.values():
-                if article['date'] is not None:
-                    article_list.append(article)
+            page = self.render_page(self.snapshot, month)
+
+            # cache the page
+            self.snapshot.cached_list[month] = page
+
+        self.write_page(page)
 
-        articles = []
-        for article in article_list:
-            articles.append({
-                "date": article["date"],
-                "dateString": article["dateString"],
-                "title": article["title"],
-                "url": article["url"]})
+    @classmethod
+    def page_url(cls, month):
+        return "/list/%d/%02d" % month
 
-        articles = sorted(articles,
-                          key=operator.itemgetter("date"),
-                          reverse=True)
-        return articles
+    @classmethod
+    def render_page(cls, snapshot, month):
+        """Render the list of articles published in a (year, month)."""
+        articles = snapshot.by_month[month]
+        html = cls.generate_page(snapshot, articles)
+        return snapshot.dated_page(('list', month), html, articles)
 
 
 class DraftController(ListController):
@@ -70,9 +98,8 @@ class DraftController(ListController):
         pass_phrase = self.get_argument("pass", None)
 
         if (pass_phrase is not None and
-                pass_phrase == BaseController.settings["pass_phrase"]):
-            articles = self._get_articles(draft=True)
-            html = self.generate_page(articles)
+                pass_phrase == self.snapshot.settings["pass_phrase"]):
+            html = self.generate_page(self.snapshot, self.snapshot.drafts)
             self.write(html)
         else:
             raise tornado.web.HTTPError(404)
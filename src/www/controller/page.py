@@ -0,0 +1,107 @@
+import email.utils
+import gzip
+import hashlib
+import io
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CachedPage(object):
+    """Rendered page with its compressed variants.
+
+    The page is encoded, hashed and compressed once when it is created, so
+    serving it from the cache costs no cpu per request.
+    """
+
+    def __init__(self, html, last_modified=None):
+        """
+        Args:
+            html: Rendered page.
+            last_modified: Unix time the page content last changed or None.
+        """
+        if not isinstance(html, bytes):
+            html = html.encode('utf-8')
+
+        self.body = html
+        self.gzip = _gzip(html)
+        self.brotli = brotli.compress(html) if brotli else None
+        self.content_hash = hashlib.sha1(html).hexdigest()
+        self.last_modified = last_modified
+
+        # bytes held by the page
+        self.size = len(self.body) + len(self.gzip) + len(self.brotli or b'')
+
+    def etag(self, encoding=None):
+        """Get the strong ETag of the page sent with the given encoding."""
+        if encoding:
+            return '"%s-%s"' % (self.content_hash, encoding)
+        return '"%s"' % self.content_hash
+
+    def is_not_modified(self, if_none_match, if_modified_since):
+        """Check request validators against the page.
+
+        If-Modified-Since is only considered without If-None-Match.
+        """
+        if if_none_match is not None:
+            etags = set([self.etag(), self.etag('gzip'), self.etag('br')])
+            for tag in if_none_match.split(','):
+                tag = tag.strip()
+                if tag.startswith('W/'):
+                    tag = tag[2:]
+                if tag == '*' or tag in etags:
+                    return True
+            return False
+
+        if if_modified_since and self.last_modified is not None:
+            since = email.utils.parsedate_tz(if_modified_since)
+            if since is None:
+                return False
+            return int(self.last_modified) <= email.utils.mktime_tz(since)
+
+        return False
+
+    def select(self, accept_encoding):
+        """Pick the variant of the page for an Accept-Encoding header.
+
+        Returns:
+            Tuple of the content encoding (None for identity) and the body.
+        """
+        encodings = _accepted_encodings(accept_encoding)
+        if self.brotli is not None and 'br' in encodings:
+            return 'br', self.brotli
+        if 'gzip' in encodings:
+            return 'gzip', self.gzip
+        return None, self.body
+
+
+def _gzip(data):
+    out = io.BytesIO()
+    # fixed mtime so the same page always compresses to the same bytes
+    stream = gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9, mtime=0)
+    try:
+        stream.write(data)
+    finally:
+        stream.close()
+    return out.getvalue()
+
+
+def _accepted_encodings(accept_encoding):
+    """Get the set of encodings in an Accept-Encoding header, ignoring q=0."""
+    encodings = set()
+    for item in accept_encoding.split(','):
+        parts = item.split(';')
+        name = parts[0].strip().lower()
+        rejected = False
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    rejected = float(value) == 0
+                except ValueError:
+                    pass
+        if name and not rejected:
+            encodings.add(name)
+    return encodings
@@ -4,14 +4,14 @@ from base import BaseController
 
 
 class RebootController(BaseController):
-    """Reboots the application by resetting initialization"""
+    """Reboots the application by reloading the articles in the background"""
 
     def get(self):
         pass_phrase = self.get_argument("pass", None)
 
         if (pass_phrase is not None and
                 pass_phrase == BaseController.settings["pass_phrase"]):
-            BaseController.initialized = False
-            self.write("reboot complete.")
+            BaseController.request_reload()
+            self.write("reboot started.")
         else:
             raise tornado.web.HTTPError(404)
@@ -0,0 +1,23 @@
+from base import BaseController
+from util.templates import views
+
+
+class SearchController(BaseController):
+    """Full-text search over the published articles."""
+
+    def get(self):
+        query = self.get_argument("q", "").strip()
+
+        articles = []
+        if query:
+            keys = self.snapshot.search_index.search(query)
+            articles = [self.snapshot.articles[key] for key in keys]
+
+        view_model = {
+                    "articles": articles,
+                    "query": query,
+                    "noResults": bool(query and not articles),
+                    "site_name": self.snapshot.settings["site_name"]
+                    }
+        self.attach_meta_data(view_model, self.snapshot.settings)
+        self.write(views.render('search', view_model))
@@ -0,0 +1,130 @@
+import time
+from xml.sax.saxutils import escape
+
+import tornado
+
+from base import BaseController
+from page import CachedPage
+
+
+# most urls a single sitemap file may list
+SITEMAP_MAX_URLS = 50000
+
+
+class SitemapController(BaseController):
+    """Sitemap of the published articles.
+
+    When there are more urls than fit a single sitemap, /sitemap.xml is a
+    sitemap index of /sitemap-<n>.xml files.
+    """
+
+    def get(self, number=None):
+
+        number = int(number) if number is not None else 0
+        count = self.sitemap_count(self.snapshot)
+        if number > count or (number and count == 1):
+            raise tornado.web.HTTPError(404)
+
+        if (self.snapshot.settings['enable_caching'] and
+            number in self.snapshot.cached_sitemaps):
+            page = self.snapshot.cached_sitemaps[number]
+        else:
+            page = self.render_page(self.snapshot, number)
+
+            # cache the sitemap
+            self.snapshot.cached_sitemaps[number] = page
+
+        self.set_header("Content-Type", "application/xml; charset=UTF-8")
+        self.write_page(page)
+
+    @classmethod
+    def sitemap_count(cls, snapshot):
+        """Get the number of sitemap files the urls are split into."""
+        url_count = len(snapshot.published) + 1
+        return (url_count + SITEMAP_MAX_URLS - 1) // SITEMAP_MAX_URLS
+
+    @classmethod
+    def sitemap_name(cls, number):
+        if number == 0:
+            return "sitemap.xml"
+        return "sitemap-%d.xml" % number
+
+    @classmethod
+    def render_page(cls, snapshot, number=0):
+        """Render a sitemap file of a snapshot.
+
+        Args:
+            number: Number of the sitemap file starting at 1, or 0 for
+                /sitemap.xml.
+        """
+        site_url = snapshot.settings["site_url"].rstrip('/')
+        count = cls.sitemap_count(snapshot)
+
+        if number == 0 and count > 1:
+            xml = [u'<?xml version="1.0" encoding="utf-8"?>',
+                   u'<sitemapindex '
+                   u'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+            for n in range(1, count + 1):
+                xml.extend([
+                    u'<sitemap>',
+                    u'<loc>%s/%s</loc>' % (escape(site_url),
+                                           cls.sitemap_name(n)),
+                    u'<lastmod>%s</lastmod>' % _w3c_date(
+                        snapshot.last_modified),
+                    u'</sitemap>'])
+            xml.append(u'</sitemapindex>')
+            return snapshot.dated_page(('sitemap', number), u'\n'.join(xml),
+                                       snapshot.published)
+
+        urls = [(site_url + '/', snapshot.last_modified)]
+        for article in snapshot.published:
+            urls.append((site_url + article.url, article.modified_time))
+
+        start = max(number - 1, 0) * SITEMAP_MAX_URLS
+        xml = [u'<?xml version="1.0" encoding="utf-8"?>',
+               u'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+        for url, modified_time in urls[start:start + SITEMAP_MAX_URLS]:
+            xml.extend([
+                u'<url>',
+                u'<loc>%s</loc>' % escape(url),
+                u'<lastmod>%s</lastmod>' % _w3c_date(modified_time),
+                u'</url>'])
+        xml.append(u'</urlset>')
+        return snapshot.dated_page(('sitemap', number), u'\n'.join(xml),
+                                   snapshot.published)
+
+
+class RobotsController(BaseController):
+    """robots.txt pointing crawlers to the sitemap."""
+
+    def get(self):
+
+        if (self.snapshot.settings['enable_caching'] and
+            'robots' in self.snapshot.cached_sitemaps):
+            page = self.snapshot.cached_sitemaps['robots']
+        else:
+            page = self.render_page(self.snapshot)
+            self.snapshot.cached_sitemaps['robots'] = page
+
+        self.set_header("Content-Type", "text/plain; charset=UTF-8")
+        self.write_page(page)
+
+    @classmethod
+    def render_page(cls, snapshot):
+        site_url = snapshot.settings["site_url"].rstrip('/')
+        lines = ["User-agent: *",
+                 "Disallow: /draft",
+                 "Disallow: /reboot",
+                 "Disallow: /search",
+                 "Disallow: /setup",
+                 "Disallow: /stats",
+                 "",
+                 "Sitemap: %s/sitemap.xml" % site_url,
+                 ""]
+        return CachedPage("\n".join(lines))
+
+
+def _w3c_date(timestamp):
+    if timestamp is None:
+        timestamp = 0
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
@@ -0,0 +1,24 @@
+import json
+
+import tornado
+
+from base import BaseController
+from util.article import content_cache
+
+
+class StatsController(BaseController):
+    """Hit, miss and eviction counts of the in-memory caches."""
+
+    def get(self):
+        pass_phrase = self.get_argument("pass", None)
+
+        if (pass_phrase is not None and
+                pass_phrase == self.snapshot.settings["pass_phrase"]):
+            stats = {
+                'page_cache': self.snapshot.cached_articles.stats(),
+                'content_cache': content_cache.stats()
+            }
+            self.set_header("Content-Type", "application/json; charset=UTF-8")
+            self.write(json.dumps(stats))
+        else:
+            raise tornado.web.HTTPError(404)
@@ -0,0 +1,123 @@
+"""
+Rendering of the most requested pages of a snapshot before it is published.
+"""
+
+import logging
+import time
+import traceback
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+
+from article import ArticleController
+from feed import AtomController, RssController
+from home import HomeController
+from list import ListController
+
+
+_FEEDS = dict((controller.feed_name, controller)
+              for controller in [AtomController, RssController])
+
+# snapshot rendered by the pool processes, they inherit it when forked
+_snapshot = None
+
+
+def warm_up(snapshot, hits):
+    """Render pages missing from the caches of a snapshot.
+
+    The home page, the list pages, the feeds and the `warm_up_articles`
+    most requested articles are rendered, in `warm_up_processes` processes
+    when configured.
+
+    Args:
+        snapshot: Snapshot about to be published.
+        hits: Recent requests per article key.
+    """
+    global _snapshot
+
+    start = time.time()
+    tasks = _tasks(snapshot, hits)
+
+    processes = snapshot.settings.get('warm_up_processes') or 0
+    if processes > 1 and ProcessPoolExecutor is None:
+        logging.warning('warm_up_processes needs concurrent.futures, '
+                        'rendering pages serially')
+        processes = 0
+
+    if processes < 2 or len(tasks) < 2:
+        pages = [_render(task, snapshot) for task in tasks]
+    else:
+        _snapshot = snapshot
+        executor = ProcessPoolExecutor(max_workers=processes)
+        try:
+            pages = list(executor.map(_render, tasks))
+        finally:
+            executor.shutdown()
+            _snapshot = None
+
+    for (kind, key), page in zip(tasks, pages):
+        if page is None:
+            continue
+        elif kind == 'home':
+            snapshot.cached_home = page
+        elif kind == 'list':
+            snapshot.cached_list[key] = page
+        elif kind == 'feed':
+            snapshot.cached_feeds[key] = page
+        else:
+            snapshot.cached_articles.put(key, page, page.size)
+
+    logging.info('warm-up: %d pages rendered in %.2fs' %
+                 (len(tasks), time.time() - start))
+
+
+def _tasks(snapshot, hits):
+    """List (kind, key) of the pages to render."""
+    tasks = []
+    if snapshot.cached_home is None:
+        tasks.append(('home', None))
+
+    for page_number in range(1, snapshot.list_page_count() + 1):
+        if page_number not in snapshot.cached_list:
+            tasks.append(('list', page_number))
+
+    for feed_name in sorted(_FEEDS):
+        if feed_name not in snapshot.cached_feeds:
+            tasks.append(('feed', feed_name))
+
+    max_articles = snapshot.settings.get('warm_up_articles') or 0
+    root_length = len(snapshot.settings['articles_url_root'])
+    keys = [article.url[root_length:] for article in snapshot.published]
+
+    # published articles are newest first, sorting keeps that order among
+    # equally requested ones
+    keys.sort(key=lambda key: hits.get(key, 0), reverse=True)
+    for key in keys[:max_articles]:
+        if key not in snapshot.cached_articles:
+            tasks.append(('article', key))
+
+    return tasks
+
+
+def _render(task, snapshot=None):
+    """Render a page, None if it failed."""
+    if snapshot is None:
+        snapshot = _snapshot
+
+    kind, key = task
+    try:
+        if kind == 'home':
+            return HomeController.render_page(snapshot)
+        elif kind == 'list':
+            return ListController.render_page(snapshot, key)
+        elif kind == 'feed':
+            return _FEEDS[key].render_page(snapshot)
+        else:
+            return ArticleController.render_page(snapshot,
+                                                 snapshot.articles[key])
+    except Exception:
+        logging.error('warm-up: rendering %s %s\n%s' %
+                      (kind, key, traceback.format_exc()))
+        return None
@@ -0,0 +1,185 @@
+#! /usr/bin/env python
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import util.settings
+from controller.base import BaseController
+from controller.home import HomeController
+from controller.list import ListController, MonthController
+from controller.article import ArticleController
+from controller.feed import AtomController, RssController
+from controller.sitemap import SitemapController, RobotsController
+from util.templates import views
+
+
+MANIFEST_FILE_NAME = '.export.manifest'
+
+
+def main(output_folder, full):
+    """Export every page of the blog as static files.
+
+    Pages are written as <url>/index.html, feeds, sitemaps and robots.txt
+    under their own names, each together with .gz and, when brotli is
+    available, .br variants, so that a web server can serve them directly
+    (nginx: try_files $uri $uri/index.html; gzip_static on;).
+
+    Args:
+        output_folder: Folder to write the site to.
+        full: Rewrite every page instead of only the changed ones.
+    """
+
+    settings = util.settings.load_settings()
+    if settings is None:
+        logging.fatal("No settings found.")
+        return -1
+
+    log_level = getattr(logging, settings['logging']['level'].upper())
+    logging.basicConfig(level=log_level,
+        format='%(asctime)s %(message)s',
+        datefmt='%m/%d/%Y %I:%M:%S %p')
+
+    views.load_all()
+    snapshot = BaseController.build_snapshot()
+
+    manifest_path = os.path.join(output_folder, MANIFEST_FILE_NAME)
+    # read for a full export too, to remove pages of deleted articles
+    prev_manifest = _read_manifest(manifest_path)
+
+    manifest = {}
+    written = 0
+    for file_name, page in _render_pages(snapshot):
+        manifest[file_name] = page.content_hash
+        if not full and prev_manifest.get(file_name) == page.content_hash:
+            continue
+        _write_page(os.path.join(output_folder, file_name), page)
+        written += 1
+
+    # remove pages of deleted articles
+    for file_name in prev_manifest:
+        if file_name not in manifest:
+            path = os.path.join(output_folder, file_name)
+            for variant in [path, path + '.gz', path + '.br']:
+                if os.path.exists(variant):
+                    os.remove(variant)
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                # not empty
+                pass
+
+    _copy_static_files(settings, output_folder)
+    _write_file(manifest_path, json.dumps(manifest))
+
+    logging.info("export: %d of %d pages written to %s" %
+                 (written, len(manifest), output_folder))
+
+
+def _render_pages(snapshot):
+    """Render all public pages and feeds of a snapshot.
+
+    Yields:
+        Tuples of file name relative to the output folder and CachedPage.
+    """
+    yield _page_file('/'), HomeController.render_page(snapshot)
+    for page_number in range(1, snapshot.list_page_count() + 1):
+        yield (_page_file(ListController.page_url(page_number)),
+               ListController.render_page(snapshot, page_number))
+
+    for month in snapshot.by_month:
+        yield (_page_file(MonthController.page_url(month)),
+               MonthController.render_page(snapshot, month))
+
+    for article in snapshot.published:
+        yield (_page_file(article.url),
+               ArticleController.render_page(snapshot, article))
+
+    yield 'feed.xml', AtomController.render_page(snapshot)
+    yield 'rss.xml', RssController.render_page(snapshot)
+
+    count = SitemapController.sitemap_count(snapshot)
+    for number in range(0, count + 1 if count > 1 else 1):
+        yield (SitemapController.sitemap_name(number),
+               SitemapController.render_page(snapshot, number))
+    yield 'robots.txt', RobotsController.render_page(snapshot)
+
+
+def _page_file(url):
+    return os.path.join(url.strip('/'), 'index.html')
+
+
+def _write_page(path, page):
+    """Write a page and its compressed variants."""
+    _write_file(path, page.body)
+    _write_file(path + '.gz', page.gzip)
+    if page.brotli is not None:
+        _write_file(path + '.br', page.brotli)
+
+
+def _write_file(path, data):
+    """Write a file through a temporary file, so it is never seen partly."""
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    fd, temp_path = tempfile.mkstemp(prefix='.', dir=folder)
+    stream = os.fdopen(fd, 'wb')
+    try:
+        stream.write(data)
+    finally:
+        stream.close()
+    os.chmod(temp_path, 0o644)
+    os.rename(temp_path, path)
+
+
+def _copy_static_files(settings, output_folder):
+    """Copy css, images and static pages, skipping unchanged files."""
+    articles_folder = settings['articles_folder'].rstrip('/')
+    folders = [('img', 'img'), ('css', 'css'), ('js', 'js'),
+               ('view/static', 'static'),
+               (os.path.join(articles_folder, 'images'), 'images')]
+
+    for source_folder, target_folder in folders:
+        for root, dirs, files in os.walk(source_folder):
+            relative_root = os.path.relpath(root, source_folder)
+            target_root = os.path.normpath(
+                os.path.join(output_folder, target_folder, relative_root))
+            if not os.path.isdir(target_root):
+                os.makedirs(target_root)
+
+            for f in files:
+                source = os.path.join(root, f)
+                target = os.path.join(target_root, f)
+                if os.path.exists(target):
+                    source_stat = os.stat(source)
+                    target_stat = os.stat(target)
+                    if (source_stat.st_size == target_stat.st_size and
+                            int(source_stat.st_mtime) ==
+                            int(target_stat.st_mtime)):
+                        continue
+                shutil.copy2(source, target)
+
+
+def _read_manifest(path):
+    """Read content hashes of the previously exported pages."""
+    try:
+        stream = open(path, 'r')
+        try:
+            return json.load(stream)
+        finally:
+            stream.close()
+    except (IOError, ValueError):
+        return {}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='blog static export.')
+    parser.add_argument('output', help="folder to export the blog to")
+    parser.add_argument('--full', action='store_true',
+        help="rewrite all pages, not only the changed ones")
+    args = parser.parse_args()
+    main(args.output, args.full)
@@ -1,10 +1,38 @@
+import hashlib
+import json
 import logging
+import os
+import shutil
+import tempfile
+import time
 import traceback
 import urllib
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+
+# bytes read from a download at a time
+_CHUNK_SIZE = 64 * 1024
+
+# seconds to wait before the first retry of a failed download, doubled
+# for each further retry
+_RETRY_DELAY = 1
+
 
 class BaseClient(object):
-    """Base class for online storage clients."""
+    """Base class for online storage clients.
+
+    Clients keep a manifest in MANIFEST_FILE_NAME of the files they
+    downloaded. Its entries hold the path relative to the local sync
+    folder, the remote revision or checksum, and the size and modified
+    time of the local file. A file is downloaded again only if the remote
+    revision differs or the local file was changed.
+    """
+
+    MANIFEST_FILE_NAME = None
 
     def _log_error(self):
         tb = traceback.format_exc()
@@ -29,3 +57,227 @@ class BaseClient(object):
         f = urllib.urlopen(url)
         s = f.read()
         logging.info('reboot sent to %s.\n %s' % (url, s))
+
+    def _download_all(self, download, items):
+        """Download files in a pool of `sync_download_threads` threads.
+
+        Args:
+            download: Function downloading the file of an item.
+            items: Items to download, e.g. file metadata.
+
+        Returns:
+            True if every file was downloaded.
+        """
+        items = list(items)
+        pool = None
+        if len(items) > 1:
+            pool = self._thread_pool('sync_download_threads')
+        try:
+            results = self._map(
+                pool, lambda item: self._try_download(download, item), items)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        return all(results)
+
+    def _thread_pool(self, setting):
+        """Get a pool with the number of threads of a setting.
+
+        Returns:
+            Thread pool, None to run serially.
+        """
+        threads = self.settings.get(setting) or 1
+        if threads > 1 and ThreadPoolExecutor is None:
+            logging.warning('%s needs concurrent.futures, running serially' %
+                            setting)
+            threads = 1
+
+        if threads < 2:
+            return None
+        return ThreadPoolExecutor(max_workers=threads)
+
+    def _map(self, pool, function, items):
+        """Call a function for each item in a pool, serially if None."""
+        if pool is None:
+            return [function(item) for item in items]
+        return list(pool.map(function, items))
+
+    def _try_download(self, download, item):
+        """Download the file of an item, retrying with backoff on errors.
+
+        Returns:
+            True if the file was downloaded.
+        """
+        retries = self.settings.get('sync_download_retries') or 1
+        delay = _RETRY_DELAY
+        for attempt in range(1, retries + 1):
+            try:
+                download(item)
+                return True
+            except Exception:
+                if attempt == retries:
+                    self._log_error()
+                    return False
+                logging.warning('download failed, retry %d of %d in %ds' %
+                                (attempt, retries - 1, delay))
+                time.sleep(delay)
+                delay *= 2
+
+    def _save_stream(self, stream, local_path, size=None, md5=None):
+        """Write a file-like object to a local file in chunks.
+
+        See `_save_file` for the arguments.
+        """
+        def copy(out):
+            while True:
+                chunk = stream.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+
+        self._save_file(copy, local_path, size, md5)
+
+    def _save_file(self, write, local_path, size=None, md5=None):
+        """Write a downloaded or generated file to a local file.
+
+        The data is written to a temporary file which is checked against
+        the expected size and checksum and then renamed to `local_path`,
+        so the web app never reads a partly written file. Only the chunks
+        being written are kept in memory.
+
+        Args:
+            write: Function writing the file content to the file object it
+                is passed, in chunks.
+            local_path: Path of the local file.
+            size: Expected size in bytes or None.
+            md5: Expected md5 hex digest or None.
+
+        Raises:
+            IOError: The file was incomplete or corrupt.
+        """
+        folder = os.path.dirname(local_path) or '.'
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                # created by another download in the meantime
+                pass
+
+        fd, temp_path = tempfile.mkstemp(prefix='.', dir=folder)
+        try:
+            out = _CheckedFile(os.fdopen(fd, 'wb'))
+            try:
+                write(out)
+            finally:
+                out.close()
+
+            if size is not None and out.size != int(size):
+                raise IOError('%s: got %d of %s bytes' %
+                              (local_path, out.size, size))
+            if md5 is not None and out.md5.hexdigest() != md5:
+                raise IOError('%s: checksum mismatch' % local_path)
+
+            os.chmod(temp_path, 0o644)
+            # replaces an existing file atomically
+            os.rename(temp_path, local_path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+
+    def _read_manifest(self):
+        """Read the manifest entries by remote file key."""
+        try:
+            stream = open(self.MANIFEST_FILE_NAME, 'r')
+            try:
+                return json.load(stream)
+            finally:
+                stream.close()
+        except (IOError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest):
+        """Replace the manifest, a failed write keeps the previous one."""
+        try:
+            self._save_file(lambda out: out.write(json.dumps(manifest)),
+                            self.MANIFEST_FILE_NAME)
+        except Exception:
+            self._log_error()
+
+    def _file_entry(self, path, rev):
+        """Get the manifest entry of a file just downloaded.
+
+        Args:
+            path: Path relative to the local sync folder.
+            rev: Remote revision or checksum of the file.
+        """
+        stat = os.stat(self.LOCAL_SYNC_FOLDER + path)
+        return {'path': path, 'rev': rev, 'size': stat.st_size,
+                'mtime': stat.st_mtime}
+
+    def _is_synced(self, entry, path, rev):
+        """Check if a local file is the remote revision of a file.
+
+        Args:
+            entry: Manifest entry of the file or None.
+            path: Remote path relative to the local sync folder.
+            rev: Remote revision or checksum.
+        """
+        if (entry is None or rev is None or entry['path'] != path or
+                entry.get('rev') != rev):
+            return False
+        try:
+            stat = os.stat(self.LOCAL_SYNC_FOLDER + path)
+        except OSError:
+            return False
+        return (stat.st_size == entry.get('size') and
+                stat.st_mtime == entry.get('mtime'))
+
+    def _remove_stale(self, paths):
+        """Remove the local files and folders not in the remote folder.
+
+        Used instead of clearing the local folder before a full sync, so
+        the site keeps its content while the files are downloaded.
+
+        Args:
+            paths: Paths of the remote files and folders relative to the
+                local sync folder.
+
+        Returns:
+            True if anything was removed.
+        """
+        root = os.path.normpath(self.LOCAL_SYNC_FOLDER)
+        keep = set(os.path.normpath(self.LOCAL_SYNC_FOLDER + path)
+                   for path in paths)
+        removed = False
+        for folder, dirs, files in os.walk(root):
+            for name in files:
+                local_name = os.path.join(folder, name)
+                if local_name not in keep:
+                    os.remove(local_name)
+                    removed = True
+            for name in list(dirs):
+                local_name = os.path.join(folder, name)
+                if local_name not in keep:
+                    shutil.rmtree(local_name)
+                    dirs.remove(name)
+                    removed = True
+        return removed
+
+
+class _CheckedFile(object):
+    """File being written which counts and hashes the data written."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+        self.md5 = hashlib.md5()
+
+    def write(self, data):
+        self.stream.write(data)
+        self.size += len(data)
+        self.md5.update(data)
+
+    def close(self):
+        self.stream.close()
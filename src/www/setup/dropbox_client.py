@@ -19,11 +19,20 @@ class DropboxClient(BaseClient):
 
     TOKEN_FILE_NAME = '_store/dropbox.access'
     DELTA_FILE_NAME = '_store/dropbox.delta'
+    MANIFEST_FILE_NAME = '_store/dropbox.manifest'
     TOKEN_STORE = {}
 
-    def __init__(self):
+    def __init__(self, api=None):
+        """
+        Args:
+            api: Object with the `delta` and `get_file` methods of
+                dropbox.client.DropboxClient to sync from, e.g. a local
+                stand-in for testing. By default a client is created from
+                the saved access token.
+        """
         self.settings = util.settings.load_settings()
         self.LOCAL_SYNC_FOLDER = self.settings['articles_folder']
+        self.api = api
 
     def get_auth_url(self, callback_url):
         """Get url for OAuth authorization.
@@ -89,20 +98,14 @@ class DropboxClient(BaseClient):
         except:
             return None
 
-    def _clear_folder(self, path):
-        """Delete all files and folder."""
-        for root, dirs, files in os.walk(path):
-            for f in files:
-                os.unlink(os.path.join(root, f))
-            for d in dirs:
-                shutil.rmtree(os.path.join(root, d))
-
     def _sync(self):
-        token = self._load_access_token()
-
-        if token is None:
-            logging.critical('dropbox access token not available, run setup.')
-            return -1
+        token = None
+        if self.api is None:
+            token = self._load_access_token()
+            if token is None:
+                logging.critical('dropbox access token not available, '
+                                 'run setup.')
+                return -1
 
         try:
             logging.info("dropbox: synchronizing")
@@ -124,55 +127,68 @@ class DropboxClient(BaseClient):
                         counter += 1
                         time.sleep(1)
             try:
-                sess = self._get_session()
-                sess.set_token(token['key'], token['secret'])
-                dropbox_client = client.DropboxClient(sess)
-                delta = dropbox_client.delta(prev_cursor)
-
-                reset = delta['reset']
-                entries = delta['entries']
-                cursor = delta['cursor']
-                #has_more = delta['has_more']
-
-                # if reset returned by dropbox, then remove all local files
-                if reset:
-                    self._clear_folder(self.LOCAL_SYNC_FOLDER)
-
-                # process each file/folder entry
-                for entry in entries:
-                    name = entry[0]
-                    meta = entry[1]
-
-                    # if entry has been deleted
-                    if meta is None:
-                        path_to_delete = "".join([self.LOCAL_SYNC_FOLDER,
-                                                  name])
-                        if os.path.exists(path_to_delete):
-                            if os.path.isdir(path_to_delete):
-                                shutil.rmtree(path_to_delete)
-                            else:
-                                os.remove(path_to_delete)
-                    else:
-                        local_path = "".join([self.LOCAL_SYNC_FOLDER,
-                                              meta['path']])
-                        remote_path = meta['path']
-                        if meta['is_dir']:
-                            try:
-                                os.makedirs(local_path)
-                            except Exception:
-                                self._log_error()
-                                error_occured = True
-                        else:
-                            try:
-                                out = open(local_path, 'w')
-                                f = dropbox_client.get_file(remote_path).read()
-                                out.write(f)
-                            except Exception:
-                                self._log_error()
-                                error_occured = True
+                dropbox_client = self.api
+                if dropbox_client is None:
+                    sess = self._get_session()
+                    sess.set_token(token['key'], token['secret'])
+                    dropbox_client = client.DropboxClient(sess)
+
+                # manifest entries of the downloaded files by lower case
+                # path
+                manifest = self._read_manifest()
+
+                # files to download by lower case path, downloaded once
+                # all delta pages are applied
+                downloads = {}
+                changed = False
+
+                # paths of the remote files and folders after a reset
+                paths = None
+
+                cursor = prev_cursor
+                has_more = True
+                while has_more:
+                    delta = dropbox_client.delta(cursor)
+
+                    reset = delta['reset']
+                    entries = delta['entries']
+                    cursor = delta['cursor']
+                    has_more = delta['has_more']
+
+                    # if reset returned by dropbox, the entries list all
+                    # files, local files not listed are removed once the
+                    # downloads are done
+                    if reset:
+                        paths = []
+                        downloads.clear()
+
+                    if entries:
+                        changed = True
+
+                    # process each file/folder entry
+                    for entry in entries:
+                        if paths is not None and entry[1] is not None:
+                            paths.append(entry[1]['path'])
+                        if not self._apply_entry(entry, manifest, downloads):
+                            error_occured = True
+
+                if not self._download_all(
+                        lambda meta: self._download_file(dropbox_client,
+                                                         meta, manifest),
+                        downloads.values()):
+                    error_occured = True
+
+                if paths is not None:
+                    self._remove_stale(paths)
+                    listed = set(path.lower() for path in paths)
+                    for name in list(manifest):
+                        if name not in listed:
+                            del manifest[name]
+
+                self._write_manifest(manifest)
 
                 # if anything changed
-                if entries:
+                if changed:
 
                     # update delta file only if no errors occured
                     if not error_occured:
@@ -200,3 +216,56 @@ class DropboxClient(BaseClient):
 
         except Exception:
             self._log_error()
+
+    def _apply_entry(self, entry, manifest, downloads):
+        """Apply a delta entry to the local folder.
+
+        Deletions and folders are applied right away, files are added to
+        `downloads` unless the manifest shows the revision was downloaded
+        already.
+
+        Returns:
+            False if the entry could not be applied.
+        """
+        name = entry[0]
+        meta = entry[1]
+
+        # if entry has been deleted
+        if meta is None:
+            path_to_delete = "".join([self.LOCAL_SYNC_FOLDER, name])
+            if os.path.exists(path_to_delete):
+                if os.path.isdir(path_to_delete):
+                    shutil.rmtree(path_to_delete)
+                else:
+                    os.remove(path_to_delete)
+
+            # files added earlier in the delta and deleted since
+            for files in (downloads, manifest):
+                for path in list(files):
+                    if path == name or path.startswith(name + '/'):
+                        del files[path]
+            return True
+
+        local_path = "".join([self.LOCAL_SYNC_FOLDER, meta['path']])
+        if meta['is_dir']:
+            try:
+                if not os.path.isdir(local_path):
+                    os.makedirs(local_path)
+            except Exception:
+                self._log_error()
+                return False
+        elif not self._is_synced(manifest.get(name), meta['path'],
+                                 meta.get('rev')):
+            downloads[name] = meta
+        return True
+
+    def _download_file(self, dropbox_client, meta, manifest):
+        """Download a file to the local folder."""
+        local_path = "".join([self.LOCAL_SYNC_FOLDER, meta['path']])
+        response = dropbox_client.get_file(meta['path'], rev=meta.get('rev'))
+        try:
+            self._save_stream(response, local_path, size=meta.get('bytes'))
+        finally:
+            response.close()
+        manifest[meta['path'].lower()] = self._file_entry(meta['path'],
+                                                          meta.get('rev'))
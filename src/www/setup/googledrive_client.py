@@ -2,9 +2,11 @@ import httplib2
 import logging
 import os.path
 import shutil
+import threading
 
 from apiclient import errors
 from apiclient.discovery import build
+from apiclient.http import HttpRequest, MediaIoBaseDownload
 from oauth2client.client import OAuth2WebServerFlow
 from oauth2client.file import Storage
 
@@ -20,6 +22,13 @@ class GoogleDriveClient(BaseClient):
     REMOTE_SYNC_FOLDER = None
     TOKEN_FILE_NAME = '_store/googledrive.access'
     DELTA_FILE_NAME = '_store/googledrive.delta'
+    MANIFEST_FILE_NAME = '_store/googledrive.manifest'
+    FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+    # metadata of the folder children returned by a single list request
+    LIST_FIELDS = ('nextPageToken,items(id,title,mimeType,labels/trashed,'
+                   'downloadUrl,md5Checksum,fileSize)')
+    # bytes requested at a time when downloading a file
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
     TOKEN_STORE = {}
 
     def __init__(self):
@@ -27,6 +36,8 @@ class GoogleDriveClient(BaseClient):
         articles_folder = self.settings["articles_folder"].rstrip('/')
         self.LOCAL_SYNC_FOLDER = "".join([articles_folder, '/'])
         self.REMOTE_SYNC_FOLDER = self.settings['google_drive_folder']
+        self._credentials = None
+        self._local = threading.local()
 
     def get_auth_url(self, callback_url):
         """Get url for OAuth authorization.
@@ -81,6 +92,7 @@ class GoogleDriveClient(BaseClient):
                     'googledrive access token not available, run setup.')
                 return -1
 
+            self._credentials = credentials
             service = self._build_service(credentials)
             folder_id = self._get_folder_id(service, self.REMOTE_SYNC_FOLDER)
 
@@ -88,75 +100,301 @@ class GoogleDriveClient(BaseClient):
                 logging.critical('google drive: sync folder not found.')
                 return -1
 
-            #check if previous sync state is saved
-            prev_cursor = None
-            #retries = 3
-            # if os.path.exists(self.DELTA_FILE_NAME):
-            #   counter = 0
-            #   while counter<retries:
-            #       try:
-            #           prev_cursor = open(self.DELTA_FILE_NAME).read()
-            #           break
-            #       except Exception, e:
-            #           logging.warning("googledrive: error reading delta file: " + self.DELTA_FILE_NAME)
-            #           counter+=1
-            #           time.sleep(1)
+            # check if previous sync state is saved
+            prev_change_id = self._read_change_id()
+            manifest = self._read_manifest()
+
+            if prev_change_id is None:
+                # changes made while downloading are picked up next time
+                largest_change_id = self._get_largest_change_id(service)
+
+                # files still in the manifest are kept, the others are
+                # removed once the downloads are done
+                prev_manifest = manifest
+                manifest = {}
+                downloads = []
+                self._sync_folder(service, folder_id, prev_manifest,
+                                  manifest, downloads)
+                changed = True
+            else:
+                changes, largest_change_id = self._retrieve_all_changes(
+                    service, prev_change_id + 1)
+                if changes is None:
+                    return
+                downloads, changed = self._apply_changes(
+                    service, folder_id, changes, manifest)
+
+            success = self._download_all(
+                lambda download: self._download_file(download, manifest),
+                downloads)
+            changed = changed or bool(downloads)
 
-            if prev_cursor is None:
-                self._clear_folder(self.LOCAL_SYNC_FOLDER)
+            if prev_change_id is None:
+                paths = [entry['path'] for entry in manifest.values()]
+                paths.extend(download[2] for download in downloads)
+                self._remove_stale(paths)
 
-            # changes = self._retrieve_all_changes(service, prev_cursor)
+            self._write_manifest(manifest)
 
-            self._sync_folder(service, folder_id, self.LOCAL_SYNC_FOLDER)
+            # update delta file only if no errors occured
+            if success:
+                self._write_change_id(largest_change_id)
 
             # send reboot command to blog engine
-            try:
-                self._reboot_engine()
-            except Exception:
-                self._log_error()
+            if changed:
+                try:
+                    self._reboot_engine()
+                except Exception:
+                    self._log_error()
 
         except Exception:
             self._log_error()
 
-    def _sync_folder(self, service, folder_id, local_path):
-        """Syncronize files and folders to local folder."""
-
-        # scan for files in the current folder
-        files = self._scan_files_in_folder(service, folder_id)
-        for file_id in files:
-            file_info = self._get_file_info(service, file_id)
-            self._download_file(service, file_info, local_path)
-
-        # scan for folders in the current folder
-        folders = self._scan_files_in_folder(service, folder_id,
-                                             foldersOnly=True)
-        for folder_id in folders:
-            folder_info = self._get_file_info(service, folder_id)
-            folder_name = "".join([local_path, folder_info['title'], '/'])
-            labels = folder_info['labels']
-            trashed = labels['trashed']
-            if not trashed:
-                if not os.path.exists(folder_name):
+    def _sync_folder(self, service, folder_id, prev_manifest, manifest,
+                     downloads, path=''):
+        """Create local folders and collect files to download.
+
+        The folder tree is listed level by level, the folders of a level in
+        a pool of `sync_list_threads` threads.
+
+        Args:
+            service: Drive service.
+            folder_id: Id of the drive folder.
+            prev_manifest: Manifest of the files already downloaded.
+            manifest: Manifest to add the folders and the files already
+                downloaded to.
+            downloads: List to add (file id, file info, path) of the other
+                files in the folder tree to.
+            path: Path of the folder relative to the local sync folder.
+        """
+        pool = self._thread_pool('sync_list_threads')
+        try:
+            # (folder id, path relative to the local sync folder)
+            level = [(folder_id, path)]
+            while level:
+                listings = self._map(
+                    pool, lambda folder: self._list_folder(service, folder[0]),
+                    level)
+
+                next_level = []
+                for (parent_id, path), children in zip(level, listings):
+                    for file_info in children:
+                        file_id = file_info['id']
+                        if file_info['mimeType'] == self.FOLDER_MIME_TYPE:
+                            folder_path = "".join(
+                                [path, file_info['title'], '/'])
+                            folder_name = self.LOCAL_SYNC_FOLDER + folder_path
+                            if not os.path.exists(folder_name):
+                                os.makedirs(folder_name)
+                            manifest[file_id] = {'path': folder_path}
+                            next_level.append((file_id, folder_path))
+                        elif self._is_downloadable(file_info):
+                            file_path = path + file_info['title']
+                            entry = prev_manifest.get(file_id)
+                            if self._is_synced(entry, file_path,
+                                               file_info.get('md5Checksum')):
+                                manifest[file_id] = entry
+                            else:
+                                downloads.append((file_id, file_info,
+                                                  file_path))
+                level = next_level
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def _apply_changes(self, service, root_id, changes, manifest):
+        """Apply entries of the changes feed to the local folder.
+
+        Deleted, trashed, moved and renamed files and folders are applied
+        right away. Files whose checksum differs from the manifest or whose
+        local file changed are returned for download. Folders moved or
+        restored into the sync folder are listed, the feed has no changes
+        for their content.
+
+        Returns:
+            Tuple of the list of (file id, file info, path) to download and
+            whether anything changed locally.
+        """
+        changed = False
+
+        # folder paths relative to the local sync folder by id
+        folders = {root_id: ''}
+        for file_id, entry in manifest.items():
+            if entry['path'].endswith('/'):
+                folders[file_id] = entry['path']
+
+        # the last change of each file counts
+        latest = {}
+        for change in changes:
+            latest[change['fileId']] = change
+
+        pending = []
+        for file_id, change in latest.items():
+            file_info = change.get('file')
+            if (change.get('deleted') or file_info is None or
+                    file_info['labels']['trashed']):
+                changed = self._remove_local(file_id, manifest,
+                                             folders) or changed
+            else:
+                pending.append(change)
+
+        downloads = []
+
+        # folders, repeated until the parents of all folders in the sync
+        # folder are known
+        progress = True
+        while progress:
+            progress = False
+            for change in list(pending):
+                file_info = change['file']
+                if file_info['mimeType'] != self.FOLDER_MIME_TYPE:
+                    continue
+                parent_path = self._get_parent_path(file_info, folders)
+                if parent_path is None:
+                    continue
+                path = "".join([parent_path, file_info['title'], '/'])
+                new = change['fileId'] not in manifest
+                changed = self._move_local(change['fileId'], path, manifest,
+                                           folders) or changed
+                folder_name = self.LOCAL_SYNC_FOLDER + path
+                if not os.path.isdir(folder_name):
                     os.makedirs(folder_name)
-                self._sync_folder(service, folder_id, folder_name)
-
-    def _download_file(self, service, file_info, local_path):
-        """Download file to local path."""
-        if file_info is None:
-            return
-        labels = file_info['labels']
-        trashed = labels['trashed']
-        if not trashed and 'downloadUrl' in file_info:
-            download_url = file_info['downloadUrl']
-            if download_url:
-                original_name = file_info['title']
-                local_file_name = local_path + original_name
-                resp, content = service._http.request(download_url)
-                if resp.status == 200:
-                    f = open(local_file_name, 'w')
-                    f.write(content)
-                else:
-                    logging.error('googledrive: an error occurred %s' % resp)
+                    changed = True
+                manifest[change['fileId']] = {'path': path}
+                folders[change['fileId']] = path
+                if new:
+                    self._sync_folder(service, change['fileId'], manifest,
+                                      manifest, downloads, path)
+                    for file_id, entry in manifest.items():
+                        if entry['path'].endswith('/'):
+                            folders[file_id] = entry['path']
+                pending.remove(change)
+                progress = True
+
+        # files queued with their folder
+        queued = set(download[0] for download in downloads)
+        for change in pending:
+            file_id = change['fileId']
+            file_info = change['file']
+            parent_path = self._get_parent_path(file_info, folders)
+
+            # moved out of the sync folder
+            if (parent_path is None or
+                    file_info['mimeType'] == self.FOLDER_MIME_TYPE):
+                changed = self._remove_local(file_id, manifest,
+                                             folders) or changed
+                continue
+
+            if not self._is_downloadable(file_info):
+                continue
+
+            path = parent_path + file_info['title']
+            changed = self._move_local(file_id, path, manifest,
+                                       folders) or changed
+            if (file_id not in queued and
+                    not self._is_synced(manifest.get(file_id), path,
+                                        file_info.get('md5Checksum'))):
+                downloads.append((file_id, file_info, path))
+
+        return downloads, changed
+
+    def _get_parent_path(self, file_info, folders):
+        """Get the local path of a parent folder, None if not synced."""
+        for parent in file_info.get('parents', []):
+            if parent['id'] in folders:
+                return folders[parent['id']]
+        return None
+
+    def _move_local(self, file_id, path, manifest, folders):
+        """Move a local file or folder to the path of its drive file.
+
+        Returns:
+            True if it was moved.
+        """
+        entry = manifest.get(file_id)
+        if entry is None or entry['path'] == path:
+            return False
+
+        old_name = self.LOCAL_SYNC_FOLDER + entry['path']
+        new_name = self.LOCAL_SYNC_FOLDER + path
+        if os.path.exists(old_name):
+            parent = os.path.dirname(new_name.rstrip('/'))
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            os.rename(old_name.rstrip('/'), new_name.rstrip('/'))
+
+        # paths of the folder content
+        old_path = entry['path']
+        entry['path'] = path
+        if old_path.endswith('/'):
+            for key, other_path in folders.items():
+                if other_path.startswith(old_path):
+                    folders[key] = path + other_path[len(old_path):]
+            for other in manifest.values():
+                if other['path'].startswith(old_path):
+                    other['path'] = path + other['path'][len(old_path):]
+        return True
+
+    def _remove_local(self, file_id, manifest, folders):
+        """Remove the local file or folder of a drive file.
+
+        Returns:
+            True if anything was removed.
+        """
+        entry = manifest.pop(file_id, None)
+        folders.pop(file_id, None)
+        if entry is None:
+            return False
+
+        path = entry['path']
+        local_name = self.LOCAL_SYNC_FOLDER + path
+        if path.endswith('/'):
+            if os.path.isdir(local_name):
+                shutil.rmtree(local_name)
+            for key, other in list(manifest.items()):
+                if other['path'].startswith(path):
+                    del manifest[key]
+                    folders.pop(key, None)
+        elif os.path.exists(local_name):
+            os.remove(local_name)
+        return True
+
+    def _is_downloadable(self, file_info):
+        """Check for a file with content, google documents have none."""
+        return (file_info is not None and
+                not file_info['labels']['trashed'] and
+                bool(file_info.get('downloadUrl')))
+
+    def _download_file(self, download, manifest):
+        """Download a file to the local sync folder."""
+        file_id, file_info, path = download
+
+        def write(out):
+            # range requests of DOWNLOAD_CHUNK_SIZE bytes
+            request = HttpRequest(self._get_http(), None,
+                                  file_info['downloadUrl'])
+            downloader = MediaIoBaseDownload(
+                out, request, chunksize=self.DOWNLOAD_CHUNK_SIZE)
+            done = False
+            while not done:
+                status, done = downloader.next_chunk()
+
+        self._save_file(write, self.LOCAL_SYNC_FOLDER + path,
+                        size=file_info.get('fileSize'),
+                        md5=file_info.get('md5Checksum'))
+        manifest[file_id] = self._file_entry(path,
+                                             file_info.get('md5Checksum'))
+
+    def _get_http(self):
+        """Get an authorized http client of the current thread.
+
+        httplib2 clients must not be shared between threads.
+        """
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._credentials.authorize(httplib2.Http())
+            self._local.http = http
+        return http
 
     def _build_service(self, credentials):
         http = httplib2.Http()
@@ -172,42 +410,47 @@ class GoogleDriveClient(BaseClient):
             folder_id = folder['id']
         return folder_id
 
-    def _scan_files_in_folder(self, service, folder_id, foldersOnly=False):
+    def _list_folder(self, service, folder_id):
+        """Get the metadata of the files and folders in a folder.
+
+        Called from the listing threads, so the requests are sent with the
+        http client of the current thread. Errors are raised, a sync with
+        folders missing must not be taken as complete.
+
+        Returns:
+            List of file infos with the fields in LIST_FIELDS.
+        """
+        query = "'{id}' in parents and trashed = false".format(id=folder_id)
         files = []
         page_token = None
         while True:
-            try:
-                param = {}
-                if page_token:
-                    param['pageToken'] = page_token
-                query = "mimeType = 'application/vnd.google-apps.folder' "
-
-                if foldersOnly:
-                    children = service.children().list(q=query,
-                        folderId=folder_id, **param).execute()
-                else:
-                    children = service.children().list(folderId=folder_id,
-                        **param).execute()
-
-                for child in children.get('items', []):
-                    files.append(child['id'])
-
-                page_token = children.get('nextPageToken')
-                if not page_token:
-                    break
-
-            except errors.HttpError, error:
-                logging.error('googledrive: %s' % error)
-                return None
+            param = {}
+            if page_token:
+                param['pageToken'] = page_token
+            children = service.files().list(
+                q=query, fields=self.LIST_FIELDS, maxResults=1000,
+                **param).execute(http=self._get_http())
+
+            files.extend(children.get('items', []))
+            page_token = children.get('nextPageToken')
+            if not page_token:
+                break
 
         return files
 
-    def _get_file_info(self, service, file_id):
-        file_info = service.files().get(fileId=file_id).execute()
-        return file_info
+    def _get_largest_change_id(self, service):
+        about = service.about().get().execute()
+        return int(about['largestChangeId'])
 
     def _retrieve_all_changes(self, service, start_change_id=None):
+        """Get the changes since a change id.
+
+        Returns:
+            Tuple of the changes and the largest change id, (None, None) on
+            errors.
+        """
         result = []
+        largest_change_id = start_change_id
         page_token = None
         while True:
             try:
@@ -219,17 +462,33 @@ class GoogleDriveClient(BaseClient):
                 changes = service.changes().list(**param).execute()
 
                 result.extend(changes['items'])
+                largest_change_id = int(changes['largestChangeId'])
                 page_token = changes.get('nextPageToken')
                 if not page_token:
                     break
             except errors.HttpError, error:
                 logging.error('googledrive: %s' % error)
-                return None
-        return result
-
-    def _clear_folder(self, path):
-        for root, dirs, files in os.walk(path):
-            for f in files:
-                os.unlink(os.path.join(root, f))
-            for d in dirs:
-                shutil.rmtree(os.path.join(root, d))
+                return None, None
+        return result, largest_change_id
+
+    def _read_change_id(self):
+        """Read the largest change id of the previous sync, None if none."""
+        try:
+            stream = open(self.DELTA_FILE_NAME, 'r')
+            try:
+                return int(stream.read().strip())
+            finally:
+                stream.close()
+        except (IOError, ValueError):
+            return None
+
+    def _write_change_id(self, change_id):
+        try:
+            stream = open(self.DELTA_FILE_NAME, 'w')
+            try:
+                stream.write(str(change_id))
+            finally:
+                stream.close()
+            logging.info('googledrive updated delta file')
+        except Exception:
+            self._log_error()
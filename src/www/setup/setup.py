@@ -1,11 +1,10 @@
 import logging
 
 # import tornado.web
-from pystache.loader import Loader
-from pystache.renderer import Renderer
 
 import util.settings
 from controller.base import BaseController
+from util.templates import setup_views
 from dropbox_client import DropboxClient
 from googledrive_client import GoogleDriveClient
 
@@ -25,11 +24,7 @@ class CloudSetupController(BaseController):
         pass_phrase = self.authenticate_request()
         if pass_phrase:
             if self.check_setup():
-                loader = Loader(extension='html', search_dirs=['view', 'view/setup'])
-                renderer = Renderer(file_extension='html',
-                    search_dirs=['view/partials', 'view/setup'])
-                template = loader.load_name('setup')
-                html = renderer.render(template, {"pass": pass_phrase})
+                html = setup_views.render('setup', {"pass": pass_phrase})
                 self.write(html)
             else:
                 self.write("setup already completed.")
@@ -96,8 +91,4 @@ class CloudCallbackController(BaseController):
 class CloudSuccessController(BaseController):
 
     def get(self):
-        loader = Loader(extension='html', search_dirs=['view', 'view/setup'])
-        template = loader.load_name('success')
-        renderer = Renderer(file_extension='html',
-                            search_dirs=['view/partials', 'view/setup'])
-        self.write(renderer.render(template, ""))
+        self.write(setup_views.render('success', ""))
@@ -0,0 +1,197 @@
+"""
+Parsed article as kept in the article store and rendered by the views.
+"""
+
+import hashlib
+import time
+
+import markdown2
+
+from util import render_cache
+from util.lru_cache import LRUCache
+
+
+# one string object per distinct date string shared by all articles
+_date_strings = {}
+
+# lazily rendered content by content hash, sized by the loader
+content_cache = LRUCache(0)
+
+
+class Article(object):
+    """Article of the blog.
+
+    The views see the attributes url, date, dateString, title, summary and
+    content. `content` may be given as a callable loading the html, it is
+    called whenever the content is needed, so only the rendered page keeps
+    the html in memory.
+    """
+
+    __slots__ = ('url', 'date', 'dateString', 'title', 'summary', '_content',
+                 'modified_time', 'content_hash')
+
+    def __init__(self, date, dateString, title, summary, content,
+                 modified_time, content_hash, url=''):
+        """
+        Args:
+            date: Published datetime, None for drafts.
+            dateString: Published date as shown on the pages.
+            title: Title without the date.
+            summary: Html of the first lines.
+            content: Html of the whole article or a callable returning it.
+            modified_time: Unix time the article file was last modified.
+            content_hash: Hash of the article file content.
+            url: Url path of the article.
+        """
+        self.url = url
+        self.date = date
+        self.dateString = _date_strings.setdefault(dateString, dateString)
+        self.title = title
+        self.summary = summary
+        self._content = content
+        self.modified_time = modified_time
+        self.content_hash = content_hash
+
+    @property
+    def content(self):
+        content = self._content
+        if callable(content):
+            return content()
+        return content
+
+    @property
+    def modified_date(self):
+        return time.ctime(self.modified_time)
+
+    @property
+    def lazy(self):
+        """True if the content is rendered when it is first needed."""
+        return isinstance(self._content, LazyContent)
+
+    def render(self):
+        """Render lazily rendered content without caching it.
+
+        See LazyContent.render.
+        """
+        return self._content.render()
+
+    def text(self):
+        """Get the text of the article for the search index.
+
+        This is the markdown of lazily rendered articles, so indexing does
+        not render them.
+        """
+        if self.lazy:
+            return self._content.source()
+        return self.content
+
+    def copy(self, **changes):
+        """Get a copy of the article with some attributes changed."""
+        article = Article(self.date, self.dateString, self.title,
+                          self.summary, self._content, self.modified_time,
+                          self.content_hash, self.url)
+        for name, value in changes.items():
+            setattr(article, name, value)
+        return article
+
+    def __eq__(self, other):
+        # summary and content are rendered from the file content
+        return (isinstance(other, Article) and
+                self.url == other.url and
+                self.date == other.date and
+                self.dateString == other.dateString and
+                self.title == other.title and
+                self.modified_time == other.modified_time and
+                self.content_hash == other.content_hash)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        # pickled for the loader processes with the content loaded, unless
+        # it is rendered lazily
+        content = self._content if self.lazy else self.content
+        return (Article, (self.date, self.dateString, self.title,
+                          self.summary, content, self.modified_time,
+                          self.content_hash, self.url))
+
+
+def last_modified(articles):
+    """Get the latest modified time of articles, None if there are none."""
+    if not articles:
+        return None
+    return max(article.modified_time for article in articles)
+
+
+class LazyContent(object):
+    """Renders the content of an article file when called.
+
+    The html is kept in `content_cache` and in the render cache, the
+    article file is read and rendered again once it left both. Html of a
+    file changed since it was loaded is not cached, the caches are keyed by
+    the content hash of the loaded version.
+    """
+
+    __slots__ = ('file_name', 'content_hash', 'summary', 'cache_key')
+
+    def __init__(self, file_name, content_hash, summary, cache_key=None):
+        """
+        Args:
+            file_name: Path to the article file.
+            content_hash: Hash of the article file content.
+            summary: Html of the first lines, stored with the content in
+                the render cache.
+            cache_key: Render cache key or None if not enabled.
+        """
+        self.file_name = file_name
+        self.content_hash = content_hash
+        self.summary = summary
+        self.cache_key = cache_key
+
+    def __call__(self):
+        content = content_cache.get(self.content_hash)
+        if content is not None:
+            return content
+
+        content, current = self.render()
+        if current:
+            content_cache.put(self.content_hash, content, len(content))
+        # otherwise served until the reload picks up the change
+        return content
+
+    def render(self):
+        """Render the content without keeping it in the content cache.
+
+        Returns:
+            Tuple of the html and whether it may be cached, which is False
+            if the file changed since it was loaded.
+        """
+        if self.cache_key is not None:
+            cached = render_cache.get(self.cache_key)
+            if cached is not None:
+                return cached[1], True
+
+        source, current = self._read()
+        content = markdown2.markdown(source)
+        if current and self.cache_key is not None:
+            render_cache.put(self.cache_key, self.summary, content)
+        return content, current
+
+    def source(self):
+        """Read the markdown of the article body."""
+        return self._read()[0]
+
+    def _read(self):
+        """Read the article file.
+
+        Returns:
+            Tuple of the markdown of the article body and whether the file
+            still has the content hash.
+        """
+        stream = open(self.file_name, 'r')
+        try:
+            lines = stream.readlines()
+        finally:
+            stream.close()
+        current = hashlib.sha1(''.join(lines)).hexdigest() == self.content_hash
+        return ''.join(lines[2:]), current
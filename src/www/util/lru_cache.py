@@ -0,0 +1,84 @@
+"""
+In-memory cache bounded by the total size of its entries.
+"""
+
+from collections import OrderedDict
+import threading
+
+
+class LRUCache(object):
+    """Cache evicting the least recently used entries once full.
+
+    Counts hits, misses and evictions for sizing the cache. Safe to use
+    from several threads.
+    """
+
+    def __init__(self, max_size):
+        """
+        Args:
+            max_size: Maximum total size of the entries, usually in bytes.
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+            # most recently used entries are kept last
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        """Store a value, evicting other entries to make room for it.
+
+        Values larger than the whole cache are not stored.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+            if size > self.max_size:
+                return
+
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                oldest = self._entries.popitem(last=False)[1]
+                self.size -= oldest[1]
+                self.evictions += 1
+
+    def items(self):
+        """Get (key, value, size) tuples, least recently used first."""
+        with self._lock:
+            return [(key, value, size)
+                    for key, (value, size) in self._entries.items()]
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'size': self.size,
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
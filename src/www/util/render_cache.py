@@ -0,0 +1,160 @@
+"""
+Persistent cache of article markdown rendered to html.
+
+Entries are stored one per file and written through a temporary file and a
+rename, so several app processes on the same host can share the cache.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import markdown2
+
+
+_CACHE_FOLDER = "_store/render_cache"
+
+# entries stored between evictions
+_EVICT_INTERVAL = 100
+
+# maximum size of the cache in bytes, kept by `put` when set
+max_size = 0
+
+_put_count = 0
+_evicting = False
+_put_lock = threading.Lock()
+
+
+def make_key(content_hash, summary_lines):
+    """Build the cache key of a rendered article.
+
+    Args:
+        content_hash: Hash of the article file content.
+        summary_lines: Number of lines the summary is made of.
+    """
+    key = "%s:%s:%s" % (content_hash, markdown2.__version__, summary_lines)
+    return hashlib.sha1(key).hexdigest()
+
+
+def get(key):
+    """Get rendered summary and content html for the key.
+
+    Returns:
+        Tuple of summary and content html, or None if not cached.
+    """
+    path = _entry_path(key)
+    try:
+        stream = open(path, 'r')
+        try:
+            entry = json.load(stream)
+        finally:
+            stream.close()
+
+        # mark the entry as recently used for eviction
+        os.utime(path, None)
+        return entry['summary'], entry['content']
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+
+def put(key, summary, content):
+    """Store rendered summary and content html for the key.
+
+    Every `_EVICT_INTERVAL` entries the cache is evicted down to `max_size`
+    in a worker thread, so entries stored while serving requests do not
+    grow it unbounded and requests do not wait for the eviction.
+    """
+    global _put_count
+
+    path = _entry_path(key)
+    folder = os.path.dirname(path)
+    try:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+    except OSError:
+        # created by another process in the meantime
+        pass
+
+    try:
+        fd, temp_path = tempfile.mkstemp(prefix='.', dir=folder)
+        stream = os.fdopen(fd, 'w')
+        try:
+            json.dump({'summary': summary, 'content': content}, stream)
+        finally:
+            stream.close()
+        os.rename(temp_path, path)
+    except Exception as e:
+        logging.error("Saving rendered article to the cache: %s %s" %
+                      (path, e))
+
+    with _put_lock:
+        _put_count += 1
+        due = _put_count % _EVICT_INTERVAL == 0
+    if due and max_size:
+        _start_evict()
+
+
+def evict(max_size):
+    """Remove least recently used entries until the cache fits max_size.
+
+    Args:
+        max_size: Maximum size of the cache in bytes.
+    """
+    entries = []
+    total_size = 0
+    for root, dirs, files in os.walk(_CACHE_FOLDER):
+        for f in files:
+            # skip entries still being written
+            if f.startswith('.'):
+                continue
+            path = os.path.join(root, f)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+    entries.sort()
+    for mtime, size, path in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            # removed by another process
+            pass
+        total_size -= size
+
+
+def _start_evict():
+    """Evict in a worker thread unless one is running already."""
+    global _evicting
+
+    with _put_lock:
+        if _evicting:
+            return
+        _evicting = True
+
+    worker = threading.Thread(target=_evict_worker)
+    worker.daemon = True
+    worker.start()
+
+
+def _evict_worker():
+    global _evicting
+
+    try:
+        evict(max_size)
+    except Exception as e:
+        logging.error("Evicting the render cache: %s" % e)
+    finally:
+        with _put_lock:
+            _evicting = False
+
+
+def _entry_path(key):
+    return os.path.join(_CACHE_FOLDER, key[:2], key)
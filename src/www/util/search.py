@@ -0,0 +1,341 @@
+"""
+In-memory full-text search over articles, ranked with BM25.
+"""
+
+from array import array
+import heapq
+import json
+import math
+import re
+import struct
+
+
+# words in the title count this many times
+TITLE_WEIGHT = 3
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+
+# length of the json part of a serialized index
+_DUMP_HEADER = struct.Struct('<I')
+
+_TAG_RE = re.compile(r'<[^>]*>')
+_ENTITY_RE = re.compile(r'&[#\w]+;')
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+_STOP_WORDS = frozenset("""
+    a about above after again against all am an and any are as at be because
+    been before being below between both but by can could did do does doing
+    down during each few for from further had has have having he her here
+    hers herself him himself his how i if in into is it its itself just me
+    more most my myself no nor not now of off on once only or other our ours
+    ourselves out over own same she should so some such than that the their
+    theirs them themselves then there these they this those through to too
+    under until up very was we were what when where which while who whom why
+    will with would you your yours yourself yourselves
+    """.split())
+
+
+def analyze(text):
+    """Split text into index terms.
+
+    Html tags are dropped, words are lower cased, stop words removed and the
+    remaining words stemmed.
+    """
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', 'ignore')
+    text = _ENTITY_RE.sub(' ', _TAG_RE.sub(' ', text))
+    terms = []
+    for word in _WORD_RE.findall(text.lower()):
+        if word not in _STOP_WORDS:
+            terms.append(stem(word))
+    return terms
+
+
+def stem(word):
+    """Strip common english suffixes off a word."""
+    if len(word) <= 3:
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('sses'):
+        return word[:-2]
+    for suffix in ('ing', 'ed'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            # running -> run
+            if len(word) > 3 and word[-1] == word[-2] and word[-1] not in 'lsz':
+                word = word[:-1]
+            return word
+    if word.endswith('ly') and len(word) > 5:
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+class SearchIndex(object):
+    """Inverted index of documents keyed by a string.
+
+    Postings are kept per term in two arrays of document ids and term
+    frequencies. An index is updated on a copy: `copy` shares all postings
+    arrays and `add`/`remove` copy only the arrays of the terms they touch,
+    so the original index stays untouched.
+
+    Each document has a version given when it was added, e.g. the hash of
+    its content, to tell whether it has to be indexed again.
+    """
+
+    def __init__(self):
+        self._term_ids = {}
+        self._postings = []
+        self._doc_ids = {}
+        self._doc_keys = []
+        self._doc_versions = []
+        self._doc_terms = []
+        self._doc_lengths = array('I')
+        self._total_length = 0
+
+        # ids of terms whose postings arrays belong to this index only
+        self._owned = set()
+
+    def __contains__(self, key):
+        return key in self._doc_ids
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    def keys(self):
+        return list(self._doc_ids)
+
+    def version(self, key):
+        """Get the version a document was added with, None if unknown."""
+        doc_id = self._doc_ids.get(key)
+        if doc_id is None:
+            return None
+        return self._doc_versions[doc_id]
+
+    def copy(self):
+        index = SearchIndex()
+        index._term_ids = dict(self._term_ids)
+        index._postings = list(self._postings)
+        index._doc_ids = dict(self._doc_ids)
+        index._doc_keys = list(self._doc_keys)
+        index._doc_versions = list(self._doc_versions)
+        index._doc_terms = list(self._doc_terms)
+        index._doc_lengths = array('I', self._doc_lengths)
+        index._total_length = self._total_length
+
+        # the postings arrays are shared now, both indexes copy them first
+        self._owned = set()
+        return index
+
+    def add(self, key, title, body, version=None):
+        """Add a document.
+
+        Args:
+            key: Key the document is returned by in search results.
+            title: Document title.
+            body: Document text, may contain html.
+            version: Version of the document, see `version`.
+        """
+        if key in self._doc_ids:
+            self.remove(key)
+
+        frequencies = {}
+        terms = analyze(title) * TITLE_WEIGHT + analyze(body)
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+
+        doc_id = len(self._doc_keys)
+        doc_terms = array('I')
+        for term, frequency in frequencies.items():
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                term_id = len(self._postings)
+                self._term_ids[term] = term_id
+                self._postings.append((array('I'), array('I')))
+                self._owned.add(term_id)
+            doc_ids, term_frequencies = self._owned_postings(term_id)
+            doc_ids.append(doc_id)
+            term_frequencies.append(frequency)
+            doc_terms.append(term_id)
+
+        self._doc_ids[key] = doc_id
+        self._doc_keys.append(key)
+        self._doc_versions.append(version)
+        self._doc_terms.append(doc_terms)
+        self._doc_lengths.append(len(terms))
+        self._total_length += len(terms)
+
+    def remove(self, key):
+        """Remove a document, unknown keys are ignored."""
+        doc_id = self._doc_ids.pop(key, None)
+        if doc_id is None:
+            return
+
+        for term_id in self._doc_terms[doc_id]:
+            doc_ids, term_frequencies = self._owned_postings(term_id)
+            position = _find(doc_ids, doc_id)
+            del doc_ids[position]
+            del term_frequencies[position]
+
+        self._total_length -= self._doc_lengths[doc_id]
+        self._doc_keys[doc_id] = None
+        self._doc_versions[doc_id] = None
+        self._doc_terms[doc_id] = None
+        self._doc_lengths[doc_id] = 0
+
+        # ids of removed documents are not reused, renumber once they
+        # make up most of the index
+        if len(self._doc_keys) > 2 * len(self._doc_ids) + 16:
+            self._compact()
+
+    def dumps(self):
+        """Serialize the index to a byte string, see `loads`."""
+        index = self.copy()
+        index._compact()
+
+        arrays = [index._doc_lengths]
+        arrays.extend(index._doc_terms)
+        for doc_ids, term_frequencies in index._postings:
+            arrays.append(doc_ids)
+            arrays.append(term_frequencies)
+
+        terms = [None] * len(index._term_ids)
+        for term, term_id in index._term_ids.items():
+            terms[term_id] = term
+
+        header = json.dumps({
+            'terms': terms,
+            'keys': index._doc_keys,
+            'versions': index._doc_versions,
+            'lengths': [len(values) for values in arrays]
+        }).encode('utf-8')
+
+        parts = [_DUMP_HEADER.pack(len(header)), header]
+        parts.extend(values.tostring() for values in arrays)
+        return b''.join(parts)
+
+    @classmethod
+    def loads(cls, data):
+        """Load an index serialized by `dumps` on the same platform.
+
+        Raises:
+            ValueError: The data is not a serialized index.
+        """
+        try:
+            header_length = _DUMP_HEADER.unpack_from(data)[0]
+            start = _DUMP_HEADER.size
+            header = json.loads(data[start:start + header_length]
+                                .decode('utf-8'))
+        except (struct.error, UnicodeDecodeError) as e:
+            raise ValueError(e)
+
+        arrays = []
+        offset = start + header_length
+        for length in header['lengths']:
+            values = array('I')
+            end = offset + length * values.itemsize
+            values.fromstring(data[offset:end])
+            arrays.append(values)
+            offset = end
+
+        if offset != len(data):
+            raise ValueError('search index is %d bytes, expected %d' %
+                             (len(data), offset))
+
+        index = cls()
+        terms = header['terms']
+        doc_count = len(header['keys'])
+        index._term_ids = dict((term, term_id)
+                               for term_id, term in enumerate(terms))
+        index._doc_keys = header['keys']
+        index._doc_versions = header['versions']
+        index._doc_ids = dict((key, doc_id)
+                              for doc_id, key in enumerate(index._doc_keys))
+        index._doc_lengths = arrays[0]
+        index._total_length = sum(arrays[0])
+        index._doc_terms = arrays[1:doc_count + 1]
+        postings = arrays[doc_count + 1:]
+        index._postings = zip(postings[::2], postings[1::2])
+        index._owned = set(range(len(index._postings)))
+        return index
+
+    def search(self, query, limit=20):
+        """Find the documents matching a query, best match first.
+
+        Returns:
+            List of document keys.
+        """
+        doc_count = len(self._doc_ids)
+        if not doc_count:
+            return []
+        average_length = float(self._total_length) / doc_count
+
+        scores = {}
+        for term in set(analyze(query)):
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            doc_ids, term_frequencies = self._postings[term_id]
+            if not doc_ids:
+                continue
+
+            idf = math.log(1 + (doc_count - len(doc_ids) + 0.5) /
+                           (len(doc_ids) + 0.5))
+            for doc_id, frequency in zip(doc_ids, term_frequencies):
+                length = self._doc_lengths[doc_id]
+                norm = _K1 * (1 - _B + _B * length / average_length)
+                score = idf * frequency * (_K1 + 1) / (frequency + norm)
+                scores[doc_id] = scores.get(doc_id, 0) + score
+
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [self._doc_keys[doc_id] for doc_id, score in best]
+
+    def _owned_postings(self, term_id):
+        """Get the postings of a term, copied first if shared."""
+        if term_id not in self._owned:
+            doc_ids, term_frequencies = self._postings[term_id]
+            self._postings[term_id] = (array('I', doc_ids),
+                                       array('I', term_frequencies))
+            self._owned.add(term_id)
+        return self._postings[term_id]
+
+    def _compact(self):
+        """Renumber documents, dropping the ids of removed ones."""
+        new_ids = {}
+        for doc_id, key in enumerate(self._doc_keys):
+            if key is not None:
+                new_ids[doc_id] = len(new_ids)
+
+        postings = []
+        for doc_ids, term_frequencies in self._postings:
+            postings.append((array('I', [new_ids[doc_id]
+                                         for doc_id in doc_ids]),
+                             array('I', term_frequencies)))
+        self._postings = postings
+        self._owned = set(range(len(postings)))
+
+        self._doc_versions = [self._doc_versions[doc_id]
+                              for doc_id in sorted(new_ids)]
+        self._doc_keys = [key for key in self._doc_keys if key is not None]
+        self._doc_terms = [terms for terms in self._doc_terms
+                           if terms is not None]
+        self._doc_lengths = array('I', [self._doc_lengths[doc_id]
+                                        for doc_id in sorted(new_ids)])
+        self._doc_ids = dict((key, doc_id)
+                             for doc_id, key in enumerate(self._doc_keys))
+
+
+def _find(doc_ids, doc_id):
+    """Binary search a sorted array of document ids."""
+    low, high = 0, len(doc_ids)
+    while low < high:
+        middle = (low + high) // 2
+        if doc_ids[middle] < doc_id:
+            low = middle + 1
+        else:
+            high = middle
+    return low
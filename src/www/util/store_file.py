@@ -0,0 +1,210 @@
+"""
+Binary snapshot of the loaded articles for fast startup.
+
+The file starts with a header and a json index of the manifest entries,
+followed by the summary and content html of all articles as concatenated
+utf-8 blobs and the serialized search index. The index refers to each blob
+by offset and length. Reading the file memory maps it, no article file is
+read, no markdown rendered and no article indexed for search. The content
+of an article is decoded from the mapping each time it is needed, the
+mapped pages are shared by all processes through the os page cache.
+Lazily rendered content is not stored.
+"""
+
+from datetime import datetime
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+import markdown2
+
+from util import render_cache
+from util.article import Article, LazyContent
+from util.search import SearchIndex
+
+
+_STORE_FILE = "_store/articles.snapshot"
+
+_MAGIC = b'APSNAP02'
+_HEADER = struct.Struct('<8sI')
+
+
+def _make_key(settings):
+    """Build the key a snapshot file is valid for.
+
+    Articles are parsed depending on settings and the markdown version, a
+    snapshot written with different ones is not used.
+    """
+    key = "%s:%s" % (json.dumps(settings, sort_keys=True, default=str),
+                     markdown2.__version__)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def read(settings):
+    """Read the manifest and the search index from the snapshot file.
+
+    Returns:
+        Tuple of the manifest of article files and the search index of the
+        published articles, both empty if there is no snapshot file for
+        the settings.
+    """
+    empty = ({}, SearchIndex())
+    try:
+        stream = open(_STORE_FILE, 'rb')
+    except IOError:
+        return empty
+
+    try:
+        header = stream.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return empty
+        magic, index_length = _HEADER.unpack(header)
+        if magic != _MAGIC:
+            return empty
+
+        index = json.loads(stream.read(index_length).decode('utf-8'))
+        if index.get('key') != _make_key(settings):
+            return empty
+
+        blobs = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # the search index is loaded into memory, it is not decoded again
+        start = _HEADER.size + index_length
+        offset, length = index['search']
+        search_index = SearchIndex.loads(
+            blobs[start + offset:start + offset + length])
+    except (IOError, OSError, ValueError, struct.error) as e:
+        logging.error("Reading the article snapshot: %s %s" %
+                      (_STORE_FILE, e))
+        return empty
+    finally:
+        stream.close()
+
+    # the mapping stays open as long as an article refers to it
+    manifest = {}
+    for file_name, entry in index['entries'].items():
+        manifest[file_name] = {
+            'mtime': entry['mtime'],
+            'size': entry['size'],
+            'hash': entry['hash'],
+            'article': _read_article(settings, file_name, entry, blobs, start)
+        }
+    return manifest, search_index
+
+
+def write(settings, manifest, search_index):
+    """Write the manifest and the search index to the snapshot file.
+
+    The file is written through a temporary file and a rename, processes
+    reading the previous snapshot are not disturbed.
+    """
+    entries = {}
+    blobs = []
+    offset = 0
+    for file_name, entry in manifest.items():
+        article = entry['article']
+        if article is not None:
+            summary = article.summary.encode('utf-8')
+            blobs.append(summary)
+            summary_span = [offset, len(summary)]
+            offset += len(summary)
+
+            # lazily rendered content is rendered again when needed
+            content_span = None
+            if not article.lazy:
+                content = article.content.encode('utf-8')
+                blobs.append(content)
+                content_span = [offset, len(content)]
+                offset += len(content)
+
+            date = article.date
+            article = {
+                'date': date.strftime('%Y-%m-%d') if date else None,
+                'dateString': article.dateString,
+                'title': article.title,
+                'summary': summary_span,
+                'content': content_span,
+                'modified_time': article.modified_time
+            }
+
+        entries[file_name] = {
+            'mtime': entry['mtime'],
+            'size': entry['size'],
+            'hash': entry['hash'],
+            'article': article
+        }
+
+    search = search_index.dumps()
+    blobs.append(search)
+    search_span = [offset, len(search)]
+
+    index = json.dumps({'key': _make_key(settings), 'entries': entries,
+                        'search': search_span})
+    index = index.encode('utf-8')
+
+    folder = os.path.dirname(_STORE_FILE)
+    try:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        fd, temp_path = tempfile.mkstemp(prefix='.', dir=folder)
+        stream = os.fdopen(fd, 'wb')
+        try:
+            stream.write(_HEADER.pack(_MAGIC, len(index)))
+            stream.write(index)
+            for blob in blobs:
+                stream.write(blob)
+        finally:
+            stream.close()
+        os.rename(temp_path, _STORE_FILE)
+    except Exception as e:
+        logging.error("Saving the article snapshot: %s %s" %
+                      (_STORE_FILE, e))
+
+
+def _read_article(settings, file_name, entry, blobs, start):
+    article = entry['article']
+    if article is None:
+        return None
+
+    summary = _read_blob(blobs, start, article['summary'])
+    if article['content'] is not None:
+        content = _Blob(blobs, start, article['content'])
+    else:
+        cache_key = None
+        if settings.get('render_cache_size'):
+            cache_key = render_cache.make_key(
+                entry['hash'], settings['homepage_summary_lines'])
+        content = LazyContent(file_name, entry['hash'], summary, cache_key)
+
+    date = article['date']
+    return Article(datetime.strptime(date, '%Y-%m-%d') if date else None,
+                   article['dateString'],
+                   article['title'],
+                   summary,
+                   content,
+                   article['modified_time'],
+                   entry['hash'])
+
+
+def _read_blob(blobs, start, span):
+    offset, length = span
+    return blobs[start + offset:start + offset + length].decode('utf-8')
+
+
+class _Blob(object):
+    """Loads html from the mapped snapshot file."""
+
+    __slots__ = ('blobs', 'start', 'span')
+
+    def __init__(self, blobs, start, span):
+        self.blobs = blobs
+        self.start = start
+        self.span = span
+
+    def __call__(self):
+        return _read_blob(self.blobs, self.start, self.span)
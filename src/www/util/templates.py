@@ -0,0 +1,135 @@
+"""
+Registry of parsed pystache templates shared by all requests.
+"""
+
+import glob
+import os
+
+from pystache.common import TemplateNotFoundError
+from pystache.loader import Loader
+from pystache.locator import Locator
+from pystache.parser import parse
+from pystache.renderer import Renderer
+
+
+# upper bound for parsed template strings kept, partials are indented
+# differently depending on where they are included
+_MAX_PARSED = 256
+
+
+class TemplateRegistry(object):
+    """Templates and partials read and parsed once per process.
+
+    With `auto_reload` set (debug mode) a template or partial is read again
+    when the modified time of its file changes.
+    """
+
+    auto_reload = False
+
+    def __init__(self, search_dirs, partial_dirs):
+        """
+        Args:
+            search_dirs: Folders to look for templates in.
+            partial_dirs: Folders to look for partials in.
+        """
+        self.search_dirs = search_dirs
+        self.partial_dirs = partial_dirs
+        self._loader = Loader(file_encoding='utf8', extension='html')
+        self._locator = Locator(extension='html')
+        self._templates = {}
+        self._partials = {}
+        self._parsed = {}
+
+    def load_all(self):
+        """Read and parse every template and partial in the folders."""
+        for search_dirs, files in ((self.search_dirs, self._templates),
+                                   (self.partial_dirs, self._partials)):
+            for folder in search_dirs:
+                for path in glob.glob(os.path.join(folder, '*.html')):
+                    name = os.path.splitext(os.path.basename(path))[0]
+                    self._get(files, name, search_dirs)
+
+    def render(self, name, context):
+        """Render the template with the given name.
+
+        Args:
+            name: Template name, the file name without extension.
+            context: View model to render.
+        """
+        template = self._get(self._templates, name, self.search_dirs)
+        renderer = _Renderer(self, file_encoding='utf8',
+                             file_extension='html', partials=self)
+        return renderer.render(template, context)
+
+    def get(self, name):
+        """Get a partial by name, used by the renderer to resolve partials.
+
+        Returns:
+            Partial template string or None if not found.
+        """
+        try:
+            return self._get(self._partials, name, self.partial_dirs)
+        except TemplateNotFoundError:
+            return None
+
+    def parse(self, template, delimiters=None):
+        """Parse a template string, reusing earlier results."""
+        key = (template, delimiters)
+        parsed = self._parsed.get(key)
+        if parsed is None:
+            parsed = parse(template, delimiters)
+            if len(self._parsed) < _MAX_PARSED:
+                self._parsed[key] = parsed
+        return parsed
+
+    def _get(self, files, name, search_dirs):
+        entry = files.get(name)
+        if entry is not None and not self.auto_reload:
+            return entry[2]
+
+        if entry is None:
+            path = self._locator.find_name(name, search_dirs)
+        else:
+            path = entry[0]
+
+        mtime = os.path.getmtime(path)
+        if entry is not None and entry[1] == mtime:
+            return entry[2]
+
+        template = self._loader.read(path)
+        if files is self._templates:
+            template = self.parse(template)
+        elif entry is not None:
+            # drop parse results of the previous partial
+            self._parsed = {}
+
+        files[name] = (path, mtime, template)
+        return template
+
+
+class _Renderer(Renderer):
+    """Renderer parsing partials through the registry.
+
+    pystache parses a partial each time it is included, the render engine
+    of this renderer takes the parse result from the registry instead.
+    """
+
+    def __init__(self, registry, **kwargs):
+        Renderer.__init__(self, **kwargs)
+        self._registry = registry
+
+    def _make_render_engine(self):
+        engine = Renderer._make_render_engine(self)
+        parse_template = self._registry.parse
+
+        def render(template, context_stack, delimiters=None):
+            parsed = parse_template(template, delimiters)
+            return parsed.render(engine, context_stack)
+
+        engine.render = render
+        return engine
+
+
+views = TemplateRegistry(['view'], ['view/partials'])
+setup_views = TemplateRegistry(['view', 'view/setup'],
+                               ['view/partials', 'view/setup'])